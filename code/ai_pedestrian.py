@@ -25,9 +25,6 @@ class AIPedestrian:
     If it succeeds, the pedestrian is added to the instances list.
     """
 
-    # We set the random seed
-    random.seed = args.seed
-
     # We try to spawn the pedestrian
     self.world = world
     self.pedestrian = world.try_spawn_actor(self.get_random_blueprint(), transform)
@@ -42,6 +39,17 @@ class AIPedestrian:
     AIPedestrian.instances.append(self)
 
 
+  @classmethod
+  def from_actors(cls, pedestrian, controller, world):
+    """Registers a pedestrian which was already spawned with its controller (see population.py)"""
+    self = cls.__new__(cls)
+    self.world = world
+    self.pedestrian = pedestrian
+    self.controller = controller
+    AIPedestrian.instances.append(self)
+    return self
+
+
   def get_random_blueprint(self):
     """Gets a random pedestrian blueprint"""
     blueprints = self.world.get_blueprint_library().filter("walker.pedestrian.*")
@@ -23,9 +23,6 @@ class AIVehicle:
     If it succeeds, the vehicle is added to the instances list.
     """
 
-    # We set the random seed
-    random.seed = args.seed
-
     # We try to spawn the vehicle
     self.world = world
     self.traffic_manager = traffic_manager
@@ -41,6 +38,21 @@ class AIVehicle:
     AIVehicle.instances.append(self)
 
 
+  @classmethod
+  def from_actor(cls, vehicle, world, traffic_manager):
+    """
+    Registers a vehicle which was already spawned with its autopilot enabled (see population.py).
+    Its lights are managed by the traffic manager.
+    """
+    self = cls.__new__(cls)
+    self.world = world
+    self.traffic_manager = traffic_manager
+    self.vehicle = vehicle
+    self.traffic_manager.update_vehicle_lights(self.vehicle, True)
+    AIVehicle.instances.append(self)
+    return self
+
+
   def get_random_blueprint(self):
     """Gets a random vehicle blueprint"""
     blueprints = self.world.get_blueprint_library().filter("vehicle")
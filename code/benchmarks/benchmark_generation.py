@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script measures the client-side cost of the generation loop (generate_sequence.py), without a
+CARLA server: the real loop runs against the fake carla package of mock_carla, whose world sends
+synthetic 1280x720 images. For each scenario (capture mode and number of ego-vehicles), it reports the
+ticks/s, the frames/s, the bytes written, and the number of calls which would be round-trips to the
+server.
+
+Script usage example:
+    python3 benchmarks/benchmark_generation.py --nb_frames 50 --output results.json
+    python3 benchmarks/benchmark_generation.py --baseline results.json --tolerance 0.2   # exits with 1 if slower
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# The fake carla package is imported instead of the real one, by the modules of the generation
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, "mock_carla"))
+sys.path.insert(1, os.path.dirname(BENCHMARKS_FOLDER))
+
+import carla
+
+from ai_pedestrian import AIPedestrian
+from ai_vehicle import AIVehicle
+from ego_vehicle import EgoVehicle
+from generate_sequence import generate_sequence, setup_world
+from generate_sequence_args import get_argparser
+
+
+# Capture mode and number of ego-vehicles of the scenarios
+SCENARIOS = [("every_tick", 1), ("every_tick", 2), ("recorded", 1), ("recorded", 2)]
+
+
+def get_folder_size(folder):
+  """Gets the number of bytes of the files of a folder"""
+  size = 0
+  for root, _, file_names in os.walk(folder):
+    for file_name in file_names:
+      size += os.path.getsize(os.path.join(root, file_name))
+  return size
+
+
+
+def run_scenario(capture_mode, nb_egos, args):
+  """Generates the sequences of a scenario in a temporary folder, and gets its measures"""
+  output_folder = tempfile.mkdtemp(prefix="dade_benchmark_")
+  generation_args = get_argparser().parse_args([
+    "--output_folder", output_folder,
+    "--csv_file", os.path.join(output_folder, "sequences.csv"),
+    "--nb_frames", str(args.nb_frames),
+    "--fps", str(args.fps),
+    "--hz", str(args.hz),
+    "--discard-duration", str(args.discard_duration),
+    "--capture-mode", capture_mode,
+    "--nb_egos", str(nb_egos),
+    "--nvehicles", str(args.nvehicles),
+    "--npedestrians", str(args.npedestrians),
+    "--dynamic_weather", args.dynamic_weather,
+    "--seed", str(args.seed),
+  ])
+
+  # The actors of a previous scenario are forgotten, in case it failed before removing them
+  for actor_class in [EgoVehicle, AIVehicle, AIPedestrian]:
+    actor_class.instances.clear()
+  carla.tick_latency = args.tick_latency
+  carla.reset_rpc_counts()
+
+  try:
+    client = carla.Client(generation_args.host, generation_args.port)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+      world, traffic_manager = setup_world(client, generation_args)
+      start = time.perf_counter()
+      folder_names = generate_sequence(client, world, traffic_manager, generation_args)
+      duration = time.perf_counter() - start
+    if args.verbose:
+      print(log.getvalue())
+
+    nb_frames = sum(len(json.load(open(os.path.join(output_folder, folder_name, "gnss.json")))) for folder_name in folder_names)
+    rpc_counts = dict(carla.rpc_counts)
+    return {
+      "capture_mode": capture_mode,
+      "nb_egos": nb_egos,
+      "duration": duration,
+      "ticks": rpc_counts.get("tick", 0),
+      "frames": nb_frames,
+      "ticks_per_second": rpc_counts.get("tick", 0)/duration,
+      "frames_per_second": nb_frames/duration,
+      "bytes_written": get_folder_size(output_folder),
+      "rpc_calls": sum(rpc_counts.values()),
+      "rpc_counts": rpc_counts,
+    }
+  finally:
+    shutil.rmtree(output_folder, ignore_errors=True)
+
+
+
+def compare(results, baseline, tolerance):
+  """Compares the frames/s of the scenarios with a baseline, and gets the regressions"""
+  regressions = []
+  reference = {(result["capture_mode"], result["nb_egos"]): result for result in baseline["scenarios"]}
+  for result in results["scenarios"]:
+    key = (result["capture_mode"], result["nb_egos"])
+    if key not in reference:
+      continue
+    previous = reference[key]
+    if result["frames_per_second"] < previous["frames_per_second"]*(1 - tolerance):
+      regressions.append(f"{key[0]} x{key[1]}: {result['frames_per_second']:.1f} frames/s instead of {previous['frames_per_second']:.1f}")
+    # The number of round-trips to the server does not depend on the machine: any increase is reported
+    if result["rpc_calls"]/max(1, result["ticks"]) > previous["rpc_calls"]/max(1, previous["ticks"])*(1 + 1e-6):
+      regressions.append(f"{key[0]} x{key[1]}: {result['rpc_calls']/max(1, result['ticks']):.1f} RPCs per tick instead of {previous['rpc_calls']/max(1, previous['ticks']):.1f}")
+  return regressions
+
+
+
+def main():
+  """Runs the scenarios, and compares them with a baseline if any"""
+  argparser = argparse.ArgumentParser(description="Benchmarks the generation loop against a fake CARLA server.")
+  argparser.add_argument("--nb_frames", default=20, type=int, help="Number of frames recorded by each ego-vehicle (default: 20)")
+  argparser.add_argument("--fps", default=5, type=int, help="Number of frames recorded per second (default: 5)")
+  argparser.add_argument("--hz", default=20, type=int, help="Number of ticks per second of simulated time (default: 20)")
+  argparser.add_argument("--discard-duration", default=0.5, type=float, help="Duration discarded before the record (default: 0.5)")
+  argparser.add_argument("--nvehicles", default=20, type=int, help="Number of AI-controlled vehicles (default: 20)")
+  argparser.add_argument("--npedestrians", default=20, type=int, help="Number of AI-controlled pedestrians (default: 20)")
+  argparser.add_argument("--dynamic_weather", default="True", type=str, help="Dynamic weather (default: True)")
+  argparser.add_argument("--seed", default=0, type=int, help="Random seed (default: 0)")
+  argparser.add_argument("--tick-latency", default=0.0, type=float, help="Simulated duration of a tick on the server, in seconds (default: 0)")
+  argparser.add_argument("--scenarios", nargs="+", default=None, help="Scenarios to run, as capture_mode:nb_egos (default: all)")
+  argparser.add_argument("--output", default=None, type=str, help="Json file where the results are saved")
+  argparser.add_argument("--baseline", default=None, type=str, help="Json file of previous results, to detect regressions")
+  argparser.add_argument("--tolerance", default=0.2, type=float, help="Relative slowdown of the frames/s tolerated by the comparison (default: 0.2)")
+  argparser.add_argument("--verbose", action="store_true", help="Prints the output of the generation")
+  args = argparser.parse_args()
+
+  scenarios = SCENARIOS
+  if args.scenarios is not None:
+    scenarios = [(scenario.split(":")[0], int(scenario.split(":")[1])) for scenario in args.scenarios]
+
+  results = {"nb_frames": args.nb_frames, "fps": args.fps, "hz": args.hz, "scenarios": []}
+  print(f"{'scenario':<16}{'ticks/s':>10}{'frames/s':>10}{'MB':>10}{'RPCs/tick':>11}")
+  for capture_mode, nb_egos in scenarios:
+    result = run_scenario(capture_mode, nb_egos, args)
+    results["scenarios"].append(result)
+    print(f"{capture_mode + ' x' + str(nb_egos):<16}{result['ticks_per_second']:>10.1f}{result['frames_per_second']:>10.1f}"
+          f"{result['bytes_written']/1e6:>10.1f}{result['rpc_calls']/max(1, result['ticks']):>11.1f}")
+    top_calls = sorted(result["rpc_counts"].items(), key=lambda item: -item[1])[:5]
+    print("  " + ", ".join(f"{name}: {count}" for name, count in top_calls))
+
+  if args.output is not None:
+    with open(args.output, "w") as fp:
+      json.dump(results, fp, indent=4)
+
+  if args.baseline is not None:
+    with open(args.baseline) as fp:
+      baseline = json.load(fp)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+      print(f"Regression: {regression}")
+    if regressions:
+      sys.exit(1)
+    print("No regression compared to the baseline.")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Fake carla package, to run the generation scripts without a CARLA server (see benchmark_generation.py).
+
+Only the part of the CARLA (0.9.14) Python API used by the generation scripts is provided. The world
+is simulated in the same process: on each tick, the vehicles move forward, and the sensors send their
+data synchronously (synthetic 1280x720 images, with a sky, buildings, a road and the hood of the
+ego-vehicle for the semantic camera). Each call that would be a round-trip to the server is counted
+in rpc_counts.
+"""
+
+from collections import Counter
+import itertools
+import random
+import time
+
+import numpy as np
+
+
+# Number of calls of each method that would be a round-trip to the server
+rpc_counts = Counter()
+
+# Simulated duration of a tick on the server (in seconds), 0 to only measure the client
+tick_latency = 0.0
+
+
+def reset_rpc_counts():
+  """Resets the counters of the round-trips to the server"""
+  rpc_counts.clear()
+
+
+def _rpc(name):
+  rpc_counts[name] += 1
+
+
+
+class Vector3D:
+  """A 3D vector"""
+
+  def __init__(self, x=0.0, y=0.0, z=0.0):
+    self.x = x
+    self.y = y
+    self.z = z
+
+  def __eq__(self, other):
+    return (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+
+
+class Location(Vector3D):
+  """A 3D location, in meters"""
+
+
+
+class Rotation:
+  """A 3D rotation, in degrees"""
+
+  def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+    self.pitch = pitch
+    self.yaw = yaw
+    self.roll = roll
+
+  def __eq__(self, other):
+    return (self.pitch, self.yaw, self.roll) == (other.pitch, other.yaw, other.roll)
+
+
+
+class Transform:
+  """A location and a rotation"""
+
+  def __init__(self, location=None, rotation=None):
+    self.location = location if location is not None else Location()
+    self.rotation = rotation if rotation is not None else Rotation()
+
+  def __eq__(self, other):
+    return self.location == other.location and self.rotation == other.rotation
+
+
+
+class WeatherParameters:
+  """The weather parameters of the world"""
+
+  def __init__(self, **parameters):
+    for name in ["sun_azimuth_angle", "sun_altitude_angle", "cloudiness", "precipitation", "precipitation_deposits",
+                 "wind_intensity", "fog_density", "fog_distance", "fog_falloff", "wetness", "scattering_intensity",
+                 "mie_scattering_scale", "rayleigh_scattering_scale"]:
+      setattr(self, name, 0.0)
+    self.__dict__.update(parameters)
+
+WeatherParameters.ClearNoon = WeatherParameters(sun_altitude_angle=45.0, cloudiness=5.0, wind_intensity=10.0, fog_distance=0.75, fog_falloff=0.1)
+
+
+
+class WorldSettings:
+  """The settings of the simulation"""
+
+  def __init__(self, **settings):
+    self.synchronous_mode = False
+    self.no_rendering_mode = False
+    self.fixed_delta_seconds = None
+    self.tile_stream_distance = 3000
+    self.actor_active_distance = 2000
+    self.__dict__.update(settings)
+
+
+
+class ActorBlueprint:
+  """The blueprint of an actor"""
+
+  def __init__(self, blueprint_id):
+    self.id = blueprint_id
+    self.attributes = {}
+
+  def set_attribute(self, name, value):
+    self.attributes[name] = value
+
+
+
+class BlueprintLibrary(list):
+  """The blueprints available in the world"""
+
+  def find(self, blueprint_id):
+    return ActorBlueprint(blueprint_id)
+
+  def filter(self, pattern):
+    prefix = pattern.rstrip("*").rstrip(".")
+    return [blueprint for blueprint in self if blueprint.id.startswith(prefix)]
+
+
+
+class SensorData:
+  """The data sent by a sensor"""
+
+  def __init__(self, frame, timestamp, **data):
+    self.frame = frame
+    self.timestamp = timestamp
+    self.__dict__.update(data)
+
+
+
+class Actor:
+  """An actor of the world: vehicle, pedestrian, controller or sensor"""
+
+  def __init__(self, world, blueprint, transform, parent=None):
+    self.world = world
+    self.id = next(world._actor_ids)
+    self.type_id = blueprint.id
+    self.attributes = dict(blueprint.attributes)
+    self.parent = parent
+    self.transform = Transform(Location(transform.location.x, transform.location.y, transform.location.z), transform.rotation)
+    self.speed = 10.0 if blueprint.id.startswith("vehicle") else 0.0
+    self._callback = None
+    self._elapsed = 0.0
+
+  def destroy(self):
+    _rpc("destroy")
+    self.world._actors.pop(self.id, None)
+    return True
+
+  def get_location(self):
+    _rpc("get_location")
+    location = self.transform.location
+    return Location(location.x, location.y, location.z)
+
+  def get_transform(self):
+    _rpc("get_transform")
+    return self.transform
+
+  def set_autopilot(self, enabled=True, port=8000):
+    _rpc("set_autopilot")
+
+  def set_simulate_physics(self, enabled=True):
+    _rpc("set_simulate_physics")
+
+  def listen(self, callback):
+    _rpc("listen")
+    self._callback = callback
+
+  def stop(self):
+    _rpc("stop")
+    self._callback = None
+
+  def start(self):
+    _rpc("start")
+
+  def go_to_location(self, location):
+    _rpc("go_to_location")
+
+
+
+class ActorSnapshot:
+  """The state of an actor at a given frame"""
+
+  def __init__(self, actor, delta_seconds):
+    location = actor.transform.location
+    self.id = actor.id
+    self._transform = Transform(Location(location.x, location.y, location.z), actor.transform.rotation)
+    self._velocity = Vector3D(actor.speed, 0.0, 0.0)
+    self._acceleration = Vector3D(0.0, 0.0, 0.0)
+    self._angular_velocity = Vector3D(0.0, 0.0, 0.0)
+
+  def get_transform(self):
+    return self._transform
+
+  def get_velocity(self):
+    return self._velocity
+
+  def get_acceleration(self):
+    return self._acceleration
+
+  def get_angular_velocity(self):
+    return self._angular_velocity
+
+
+
+class WorldSnapshot:
+  """The state of all the actors of the world at a given frame"""
+
+  def __init__(self, frame, elapsed_seconds, actors, delta_seconds):
+    self.frame = frame
+    self.timestamp = Timestamp(frame, elapsed_seconds, delta_seconds)
+    self._actors = {actor.id: ActorSnapshot(actor, delta_seconds) for actor in actors if actor.parent is None}
+
+  def find(self, actor_id):
+    return self._actors.get(actor_id)
+
+  def has_actor(self, actor_id):
+    return actor_id in self._actors
+
+  def __len__(self):
+    return len(self._actors)
+
+
+
+class Timestamp:
+  """The time of a frame"""
+
+  def __init__(self, frame, elapsed_seconds, delta_seconds):
+    self.frame = frame
+    self.elapsed_seconds = elapsed_seconds
+    self.delta_seconds = delta_seconds
+
+
+
+class Light:
+  """A street light"""
+
+  def __init__(self, light_id):
+    self.id = light_id
+
+
+
+class LightManager:
+  """The street lights of the world"""
+
+  def __init__(self, nb_lights=1000):
+    self._lights = [Light(i) for i in range(nb_lights)]
+
+  def get_all_lights(self, light_group=None):
+    _rpc("get_all_lights")
+    return list(self._lights)
+
+  def set_active(self, lights, active):
+    _rpc("set_active")
+
+
+
+class Map:
+  """The map of the world"""
+
+  def __init__(self, name):
+    self.name = name
+
+  def get_spawn_points(self):
+    _rpc("get_spawn_points")
+    return [Transform(Location(20.0*(i % 25), 50.0*(i // 25), 0.5)) for i in range(200)]
+
+
+
+class World:
+  """The simulated world, ticked by the client"""
+
+  def __init__(self, map_name):
+    self.map_name = map_name
+    self._frame = 0
+    self._elapsed_seconds = 0.0
+    self._actor_ids = itertools.count(1)
+    self._actors = {}
+    self._callbacks = {}
+    self._callback_ids = itertools.count(1)
+    self._settings = WorldSettings()
+    self._weather = WeatherParameters()
+    self._light_manager = LightManager()
+    self._images = {}
+
+  def get_settings(self):
+    _rpc("get_settings")
+    return self._settings
+
+  def apply_settings(self, settings):
+    _rpc("apply_settings")
+    self._settings = settings
+    return self._frame
+
+  def on_tick(self, callback):
+    callback_id = next(self._callback_ids)
+    self._callbacks[callback_id] = callback
+    return callback_id
+
+  def remove_on_tick(self, callback_id):
+    self._callbacks.pop(callback_id, None)
+
+  def get_weather(self):
+    _rpc("get_weather")
+    return self._weather
+
+  def set_weather(self, weather):
+    _rpc("set_weather")
+    self._weather = weather
+
+  def get_lightmanager(self):
+    return self._light_manager
+
+  def get_map(self):
+    _rpc("get_map")
+    return Map(self.map_name)
+
+  def get_blueprint_library(self):
+    _rpc("get_blueprint_library")
+    blueprints = ["vehicle.audi.a2", "vehicle.tesla.model3", "vehicle.nissan.micra", "walker.pedestrian.0001", "walker.pedestrian.0002"]
+    return BlueprintLibrary([ActorBlueprint(blueprint_id) for blueprint_id in blueprints])
+
+  def try_spawn_actor(self, blueprint, transform, attach_to=None):
+    _rpc("try_spawn_actor")
+    return self._spawn(blueprint, transform, attach_to)
+
+  def spawn_actor(self, blueprint, transform, attach_to=None):
+    _rpc("spawn_actor")
+    return self._spawn(blueprint, transform, attach_to)
+
+  def get_random_location_from_navigation(self):
+    _rpc("get_random_location_from_navigation")
+    return Location(random.uniform(0, 500), random.uniform(0, 400), 0.5)
+
+  def get_actors(self, actor_ids=None):
+    _rpc("get_actors")
+    if actor_ids is None:
+      return list(self._actors.values())
+    return [self._actors[actor_id] for actor_id in actor_ids if actor_id in self._actors]
+
+  def tick(self, seconds=10.0):
+    """Moves the vehicles forward, and sends the data of the world and of the sensors"""
+    _rpc("tick")
+    if tick_latency > 0:
+      time.sleep(tick_latency)
+    delta_seconds = self._settings.fixed_delta_seconds or 0.05
+    self._frame += 1
+    self._elapsed_seconds += delta_seconds
+    for actor in self._actors.values():
+      actor.transform.location.x += actor.speed*delta_seconds
+
+    snapshot = WorldSnapshot(self._frame, self._elapsed_seconds, self._actors.values(), delta_seconds)
+    for callback in list(self._callbacks.values()):
+      callback(snapshot)
+    for actor in list(self._actors.values()):
+      if actor._callback is not None and self._is_sensor_ticking(actor, delta_seconds):
+        actor._callback(self._get_sensor_data(actor, snapshot.timestamp.elapsed_seconds))
+    return self._frame
+
+  def _spawn(self, blueprint, transform, attach_to=None):
+    actor = Actor(self, blueprint, transform, attach_to)
+    self._actors[actor.id] = actor
+    return actor
+
+  def _is_sensor_ticking(self, sensor, delta_seconds):
+    sensor_tick = float(sensor.attributes.get("sensor_tick", "0"))
+    if sensor_tick <= 0:
+      return True
+    sensor._elapsed += delta_seconds
+    if sensor._elapsed + 1e-9 < sensor_tick:
+      return False
+    sensor._elapsed -= sensor_tick
+    return True
+
+  def _get_sensor_data(self, sensor, elapsed_seconds):
+    if sensor.type_id == "sensor.other.gnss":
+      location = sensor.parent.transform.location if sensor.parent is not None else sensor.transform.location
+      return SensorData(self._frame, elapsed_seconds, latitude=location.y*1e-5, longitude=location.x*1e-5, altitude=location.z)
+
+    # The images are shifted by one column per frame, so that they are not all identical
+    width = int(sensor.attributes.get("image_size_x", 1280))
+    height = int(sensor.attributes.get("image_size_y", 720))
+    key = (sensor.type_id, width, height)
+    if key not in self._images:
+      self._images[key] = _make_image(sensor.type_id, width, height)
+    image = np.roll(self._images[key], self._frame, axis=1)
+    return SensorData(self._frame, elapsed_seconds, width=width, height=height, fov=90.0, raw_data=image.tobytes())
+
+
+
+def _make_image(type_id, width, height):
+  """Makes a synthetic BGRA image: the tags of the semantic camera are in the red channel"""
+  rows, columns = np.indices((height, width))
+  tags = np.full((height, width), 11, dtype=np.uint8) # sky
+  tags[(rows > 0.3*height) & (rows <= 0.5*height)] = 3 # buildings
+  tags[(rows > 0.45*height) & (rows <= 0.5*height) & (columns % 97 < 40)] = 9 # vegetation
+  tags[rows > 0.5*height] = 1 # road
+  tags[(rows > 0.5*height) & (np.abs(columns - width/2) < 4 + (rows - 0.5*height)*0.02)] = 24 # road line
+  tags[(rows > 0.48*height) & (rows <= 0.55*height) & (np.abs(columns - 0.3*width) < 0.05*width)] = 14 # car
+  tags[((columns - width/2)/(0.6*width))**2 + ((rows - height)/(0.2*height))**2 < 1] = 14 # hood of the ego-vehicle
+
+  bgra = np.full((height, width, 4), 255, dtype=np.uint8)
+  if type_id == "sensor.camera.semantic_segmentation":
+    bgra[:, :, :3] = 0
+    bgra[:, :, 2] = tags
+  else:
+    # Colors depending on the tags, with a gradient and some noise
+    rng = np.random.default_rng(0)
+    base = (tags.astype(np.int32)*37) % 200
+    for channel in range(3):
+      bgra[:, :, channel] = np.clip(base + channel*20 + rows*30//height + rng.integers(0, 8, (height, width)), 0, 255)
+  return bgra
+
+
+
+class TrafficManager:
+  """The traffic manager, which drives the vehicles with autopilot"""
+
+  def __init__(self, port):
+    self.port = port
+
+  def get_port(self):
+    return self.port
+
+  def __getattr__(self, name):
+    # All the setters of the traffic manager
+    def setter(*args, **kwargs):
+      _rpc("traffic_manager." + name)
+    return setter
+
+
+
+class Client:
+  """The client connected to the (fake) server"""
+
+  def __init__(self, host="127.0.0.1", port=2000):
+    self.host = host
+    self.port = port
+    self._world = None
+
+  def set_timeout(self, seconds):
+    pass
+
+  def load_world(self, map_name):
+    _rpc("load_world")
+    self._world = World(map_name)
+    return self._world
+
+  def get_world(self):
+    _rpc("get_world")
+    if self._world is None:
+      self._world = World("Town10HD")
+    return self._world
+
+  def get_trafficmanager(self, port=8000):
+    _rpc("get_trafficmanager")
+    return TrafficManager(port)
+
+  def apply_batch_sync(self, commands, do_tick=False):
+    _rpc("apply_batch_sync")
+    return [command._apply(self._world) for command in commands]
+
+  def apply_batch(self, commands):
+    _rpc("apply_batch")
+    for command in commands:
+      command._apply(self._world)
+
+
+
+class command:
+  """The commands which can be applied by batches"""
+
+  FutureActor = 0
+
+  class Response:
+    def __init__(self, actor_id=0, error=""):
+      self.actor_id = actor_id
+      self.error = error
+
+    def has_error(self):
+      return bool(self.error)
+
+  class SpawnActor:
+    def __init__(self, blueprint, transform, parent=None):
+      self.blueprint = blueprint
+      self.transform = transform
+      self.parent = parent
+      self.then_commands = []
+
+    def then(self, command):
+      self.then_commands.append(command)
+      return self
+
+    def _apply(self, world):
+      # Some spawn points are already occupied, as in the simulator
+      if self.blueprint.id.startswith("vehicle") and random.random() < 0.1:
+        return command.Response(error="Spawn failed because of collision at spawn position")
+      parent = world._actors.get(getattr(self.parent, "id", self.parent)) if self.parent is not None else None
+      actor = world._spawn(self.blueprint, self.transform, parent)
+      return command.Response(actor.id)
+
+  class SetAutopilot:
+    def __init__(self, actor, enabled=True, port=8000):
+      pass
+
+    def _apply(self, world):
+      return command.Response()
+
+  class DestroyActor:
+    def __init__(self, actor):
+      self.actor_id = getattr(actor, "id", actor)
+
+    def _apply(self, world):
+      world._actors.pop(self.actor_id, None)
+      return command.Response(self.actor_id)
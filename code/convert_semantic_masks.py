@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script can be used to rebuild the semantic_masks (png, DADE palette) and semantic_masks_npz (npz,
+DADE IDs) folders of sequences from their semantic_masks_carla folder, for instance after a change of
+the label mapping. The frames are converted in parallel, by a pool of processes.
+
+Script usage example:
+    python3 convert_semantic_masks.py path/to/DADE \\     # dataset root, weather folder(s) or sequence folder(s)
+                                      --mapping mapping.json  # changes of the label mapping (optional)
+
+The mapping file is a json dictionary, which changes the default mapping of semantic_labels.py:
+    {"carla_to_dade": {"terrain": 16, "24": 0}, "palette": {"16": [152, 251, 152]}}
+where the CARLA classes are given by tag or by name.
+
+Frames whose outputs are more recent than their CARLA mask, and were converted with the same mapping,
+are skipped.
+"""
+
+import argparse
+import hashlib
+import json
+from multiprocessing import Pool
+import os
+import time
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from semantic_labels import CARLA_CLASSES, CARLA_TO_DADE_LUT, DADE_PALETTE, carla_to_dade, get_color_keys, get_color_to_tag_lut
+
+
+# Name of the file recording the mapping used for the masks of a sequence
+MAPPING_STAMP = ".semantic_mapping"
+
+# Lookup tables of the worker processes, set by _init_worker
+_color_to_tag = None
+_tag_to_id = None
+_palette = None
+
+
+def load_mapping(path=None):
+  """
+  Gets the lookup tables giving the DADE ID of each CARLA tag and the color of each DADE ID: the default
+  ones of semantic_labels.py, changed by the mapping file at the given path (if any).
+  """
+  tag_to_id = CARLA_TO_DADE_LUT.copy()
+  palette = DADE_PALETTE.copy()
+  if path is None:
+    return tag_to_id, palette
+
+  with open(path) as fp:
+    mapping = json.load(fp)
+  tags = {name: tag for tag, name, _ in CARLA_CLASSES}
+  for key, label_id in mapping.get("carla_to_dade", {}).items():
+    if key in tags:
+      tag = tags[key]
+    elif key.isdigit():
+      tag = int(key)
+    else:
+      raise Exception(f"Unknown CARLA class {key}!")
+    tag_to_id[tag] = label_id
+  for key, color in mapping.get("palette", {}).items():
+    palette[int(key)] = color
+  return tag_to_id, palette
+
+
+
+def get_mapping_hash(tag_to_id, palette):
+  """Gets a hash of the lookup tables, to detect the masks converted with another mapping"""
+  return hashlib.sha1(tag_to_id.tobytes() + palette.tobytes()).hexdigest()
+
+
+
+def find_sequences(paths):
+  """Gets the sequence folders (the ones having a semantic_masks_carla folder) under the given paths"""
+  sequences = []
+  for path in paths:
+    for root, dirs, _ in os.walk(path):
+      if "semantic_masks_carla" in dirs:
+        sequences.append(root)
+        dirs[:] = [] # The masks of a sequence are not searched
+  return sorted(sequences)
+
+
+
+def get_frames(sequence, force=False):
+  """
+  Gets the frames of a sequence to convert, as tuples (carla mask, palette mask, npz mask), and the
+  number of frames which are already up to date.
+  """
+  frames = []
+  nb_up_to_date = 0
+  carla_folder = os.path.join(sequence, "semantic_masks_carla")
+  for dir_name in sorted(os.listdir(carla_folder)):
+    for file_name in sorted(os.listdir(os.path.join(carla_folder, dir_name))):
+      if not file_name.endswith(".png"):
+        continue
+      name = os.path.splitext(file_name)[0]
+      frame = (os.path.join(carla_folder, dir_name, file_name),
+               os.path.join(sequence, "semantic_masks", dir_name, name + ".png"),
+               os.path.join(sequence, "semantic_masks_npz", dir_name, name + ".npz"))
+      if not force and is_up_to_date(*frame):
+        nb_up_to_date += 1
+      else:
+        frames.append(frame)
+  return frames, nb_up_to_date
+
+
+
+def is_up_to_date(carla_path, png_path, npz_path):
+  """Checks that the outputs of a frame exist, and are more recent than its CARLA mask"""
+  try:
+    source_time = os.stat(carla_path).st_mtime
+    return os.stat(png_path).st_mtime >= source_time and os.stat(npz_path).st_mtime >= source_time
+  except FileNotFoundError:
+    return False
+
+
+
+def read_stamp(sequence):
+  """Gets the hash of the mapping used for the masks of a sequence, or None"""
+  try:
+    with open(os.path.join(sequence, MAPPING_STAMP)) as fp:
+      return fp.read().strip()
+  except FileNotFoundError:
+    return None
+
+
+
+def write_stamp(sequence, mapping_hash):
+  """Records the hash of the mapping used for the masks of a sequence"""
+  with open(os.path.join(sequence, MAPPING_STAMP), 'w') as fp:
+    fp.write(mapping_hash + "\n")
+
+
+
+def _init_worker(tag_to_id, palette):
+  global _color_to_tag, _tag_to_id, _palette
+  _color_to_tag = get_color_to_tag_lut()
+  _tag_to_id = tag_to_id
+  _palette = palette
+
+
+
+def _convert_frame(frame):
+  carla_path, png_path, npz_path = frame
+  with Image.open(carla_path) as image:
+    rgb = np.asarray(image.convert("RGB"))
+  ids = carla_to_dade(_color_to_tag[get_color_keys(rgb)], _tag_to_id)
+
+  os.makedirs(os.path.dirname(png_path), exist_ok=True)
+  Image.fromarray(_palette[ids], "RGB").save(png_path)
+  os.makedirs(os.path.dirname(npz_path), exist_ok=True)
+  np.savez_compressed(npz_path, ids)
+  return frame
+
+
+
+def main():
+  """Converts the CARLA semantic masks of the given sequences"""
+  argparser = argparse.ArgumentParser(description="Rebuilds semantic_masks and semantic_masks_npz from semantic_masks_carla.")
+  argparser.add_argument("paths", nargs="+", help="Path to the dataset, weather or sequence folders")
+  argparser.add_argument("--mapping", default=None, type=str, help="Json file changing the label mapping (default: mapping of semantic_labels.py)")
+  argparser.add_argument("--workers", default=os.cpu_count(), type=int, help="Number of processes (default: number of cores)")
+  argparser.add_argument("--force", action="store_true", help="Converts all the frames, even the ones which are up to date")
+  args = argparser.parse_args()
+
+  tag_to_id, palette = load_mapping(args.mapping)
+  mapping_hash = get_mapping_hash(tag_to_id, palette)
+
+  # We list the frames to convert. All the frames of a sequence converted with another mapping are converted again.
+  frames = []
+  nb_up_to_date = 0
+  sequences = find_sequences(args.paths)
+  for sequence in sequences:
+    same_mapping = read_stamp(sequence) == mapping_hash
+    if not same_mapping and os.path.exists(os.path.join(sequence, MAPPING_STAMP)):
+      os.remove(os.path.join(sequence, MAPPING_STAMP))
+    sequence_frames, nb_sequence_up_to_date = get_frames(sequence, args.force or not same_mapping)
+    frames += sequence_frames
+    nb_up_to_date += nb_sequence_up_to_date
+  print(f"{len(sequences)} sequences: {len(frames)} frames to convert, {nb_up_to_date} frames up to date.")
+
+  start = time.perf_counter()
+  with Pool(max(1, args.workers), _init_worker, (tag_to_id, palette)) as pool:
+    for _ in tqdm(pool.imap_unordered(_convert_frame, frames, chunksize=16), "Converting frames", total=len(frames)):
+      pass
+  duration = time.perf_counter() - start
+
+  # The mapping is recorded once all the frames of the sequences are converted
+  for sequence in sequences:
+    write_stamp(sequence, mapping_hash)
+  print(f"Converted {len(frames)} frames in {duration:.1f} s ({len(frames)/max(duration, 1e-9):.1f} frames/s).")
+
+
+if __name__ == "__main__":
+  main()
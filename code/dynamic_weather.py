@@ -2,12 +2,140 @@
 # -*- coding: utf-8 -*-
 
 """
-Dynamic Weather parameters class defintions. 
+Dynamic Weather parameters class defintions.
 
 This code was inspired by one of the carla GitHub (https://github.com/carla-simulator/carla/blob/master/PythonAPI/examples/dynamic_weather.py).
+
+The weather of a sequence only depends on its timestamp, so that the weather.json file of a sequence
+can also be computed offline with:
+    python3 dynamic_weather.py path/to/sequence
 """
 
+import argparse
+import bisect
+import json
 import math
+import os
+
+import numpy as np
+
+
+# Duration of the whole time frame (5 hours), of each weather period and of the transition at the
+# beginning of each period, in seconds
+TIME_FRAME_DURATION = 18000
+PERIOD_DURATION = 600
+TRANSITION_DURATION = 10
+
+# Values of the weather parameters for clear, rainy and foggy weathers
+VARYING_PARAMETERS = ("cloudiness", "precipitation", "precipitation_deposits", "wind_intensity", "fog_density")
+WEATHER_TYPES = {
+    #          cloudiness, precipitation, precipitation_deposits, wind_intensity, fog_density
+    "clear":  (5,          0,             0,                      10,             2),
+    "rainy":  (50,         90,            80,                     100,            7),
+    "foggy":  (50,         0,             0,                      10,             70),
+}
+
+# Values of the parameters which do not change over time
+CONSTANT_PARAMETERS = {
+    "fog_distance": 0.75,
+    "fog_falloff": 0.1,
+    "wetness": 0.0,
+    "scattering_intensity": 1.0,
+    "mie_scattering_scale": 0.03,
+    "rayleigh_scattering_scale": 0.0331,
+}
+
+# Weather schedule: end of each 10-minute period and its weather. Except for the first one, each
+# period starts with a smooth transition from the weather of the previous period.
+WEATHER_SCHEDULE = [
+    (600, "clear"), (1200, "rainy"), (1800, "foggy"), (2400, "rainy"), (3000, "foggy"),
+    (3600, "clear"), (4200, "foggy"), (4800, "clear"), (5400, "rainy"), (6000, "clear"),
+    (6600, "foggy"), (7200, "rainy"), (7800, "foggy"), (8400, "clear"), (9000, "rainy"),
+    (9600, "clear"), (10200, "foggy"), (10800, "rainy"), (11400, "foggy"), (12000, "rainy"),
+    (12600, "clear"), (13200, "rainy"), (13800, "foggy"), (14400, "clear"), (15000, "rainy"),
+    (15600, "clear"), (16200, "foggy"), (16800, "clear"), (17400, "foggy"), (18000, "rainy"),
+]
+
+# Lookup tables derived from the schedule
+_PERIOD_ENDS = [end for end, _ in WEATHER_SCHEDULE]
+_PERIOD_VALUES = [WEATHER_TYPES[weather_type] for _, weather_type in WEATHER_SCHEDULE]
+_PREVIOUS_PERIOD_VALUES = _PERIOD_VALUES[:1] + _PERIOD_VALUES[:-1]
+
+# Parameters saved for each frame in a weather.json file
+WEATHER_JSON_PARAMETERS = ("sun_azimuth_angle", "sun_altitude_angle", "cloudiness", "precipitation",
+                           "precipitation_deposits", "wind_intensity", "fog_density", "fog_distance",
+                           "fog_falloff", "wetness", "scattering_intensity", "mie_scattering_scale",
+                           "rayleigh_scattering_scale")
+
+
+def get_weather_values(t):
+    """
+    Gets the values of the VARYING_PARAMETERS at time t, or None if t is outside of the time frame.
+    The period containing t is found by a binary search in the schedule.
+    """
+    if t < 0 or t > TIME_FRAME_DURATION:
+        return None
+    period = bisect.bisect_left(_PERIOD_ENDS, t)
+    values = _PERIOD_VALUES[period]
+    elapsed = t - (_PERIOD_ENDS[period] - PERIOD_DURATION)
+    if period > 0 and elapsed < TRANSITION_DURATION:
+        # We are in the transition from the weather of the previous period
+        previous_values = _PREVIOUS_PERIOD_VALUES[period]
+        return tuple(previous + (value - previous)*elapsed/TRANSITION_DURATION for previous, value in zip(previous_values, values))
+    return values
+
+
+
+def get_weather_timeline(timestamps):
+    """
+    Computes the weather for an array of timestamps at once.
+    Returns a dictionary giving an array of values for each of the WEATHER_JSON_PARAMETERS.
+    The values are NaN for the timestamps outside of the time frame.
+    """
+    t = np.asarray(timestamps, dtype=np.float64)
+    outside = (t < 0) | (t > TIME_FRAME_DURATION)
+
+    # We compute the position of the sun
+    timeline = {
+        "sun_azimuth_angle": t * 360/TIME_FRAME_DURATION,
+        "sun_altitude_angle": 30 * np.sin((3/2 * math.pi + t * 2 * math.pi / TIME_FRAME_DURATION) % (2.0 * math.pi)) + 15,
+    }
+
+    # We look up the period of each timestamp, and interpolate the values during the transitions
+    period = np.searchsorted(_PERIOD_ENDS, t, side="left").clip(0, len(_PERIOD_ENDS)-1)
+    values = np.array(_PERIOD_VALUES, dtype=np.float64)[period]
+    previous_values = np.array(_PREVIOUS_PERIOD_VALUES, dtype=np.float64)[period]
+    elapsed = (t - (np.array(_PERIOD_ENDS, dtype=np.float64)[period] - PERIOD_DURATION))[:, np.newaxis]
+    transition = ((period > 0)[:, np.newaxis] & (elapsed < TRANSITION_DURATION))
+    values = np.where(transition, previous_values + (values - previous_values)*elapsed/TRANSITION_DURATION, values)
+    for i, name in enumerate(VARYING_PARAMETERS):
+        timeline[name] = values[:, i]
+
+    for name, value in CONSTANT_PARAMETERS.items():
+        timeline[name] = np.full(t.shape, value)
+
+    for name in timeline:
+        timeline[name] = np.where(outside, np.nan, timeline[name])
+    return {name: timeline[name] for name in WEATHER_JSON_PARAMETERS}
+
+
+
+def get_frame_timestamps(seq_timestamp, nb_frames, hz=10, fps=1, discard_duration=3.0, skipped_frames=()):
+    """
+    Gets the timestamp of the frames of a sequence, as computed by generate_sequence.py: the weather is
+    updated after each world tick, including the discarded ones, and a frame is saved every hz/fps ticks.
+    The frames lost during the generation (skipped_frames of the sequence json file) are not numbered,
+    so that the frames after them are later than their number suggests. The timestamps of the sequences
+    captured with --capture-mode recorded, whose cameras choose their capture ticks, are only given by
+    their ego_state.json file.
+    """
+    hz = max(hz, fps)
+    ticks_to_discard = int(discard_duration * hz)
+    skipped_frames = set(skipped_frames)
+    slots = np.array([slot for slot in range(nb_frames + len(skipped_frames)) if slot + 1 not in skipped_frames][:nb_frames])
+    ticks = ticks_to_discard + 1 + slots * hz / fps
+    return seq_timestamp + ticks / hz
+
 
 
 class Sun(object):
@@ -40,12 +168,8 @@ class Weather(object):
         self.sun = Sun(t)
         self._update_weather_parameters(t)
         # We set the value of the parameters which will not change value over time
-        self.weather.fog_distance = 0.75
-        self.weather.fog_falloff = 0.1
-        self.weather.wetness = 0.0
-        self.weather.scattering_intensity = 1.0
-        self.weather.mie_scattering_scale = 0.03
-        self.weather.rayleigh_scattering_scale = 0.0331
+        for name, value in CONSTANT_PARAMETERS.items():
+            setattr(self.weather, name, value)
 
     def tick(self, t):
         self.sun.tick(t)
@@ -56,94 +180,58 @@ class Weather(object):
         self.weather.sun_azimuth_angle = self.sun.azimuth
         self.weather.sun_altitude_angle = self.sun.altitude
 
-        # Values of the weather parameters for clear, rainy and foggy weathers
-        CLOUDINESS_CLEAR = 5
-        PRECIPITATION_CLEAR = 0
-        PRECIPITATION_DEPOSIT_CLEAR = 0
-        WIND_INTENSITY_CLEAR = 10
-        FOG_DENSITY_CLEAR = 2
-
-        CLOUDINESS_RAINY = 50
-        PRECIPITATION_RAINY = 90
-        PRECIPITATION_DEPOSIT_RAINY = 80
-        WIND_INTENSITY_RAINY = 100
-        FOG_DENSITY_RAINY = 7
-
-        CLOUDINESS_FOGGY = 50
-        PRECIPITATION_FOGGY = 0
-        PRECIPITATION_DEPOSIT_FOGGY = 0
-        WIND_INTENSITY_FOGGY = 10
-        FOG_DENSITY_FOGGY = 70
-
         # We update the other weather parameters if needed
-        if (t>=0 and t<=600) or (t>=3010 and t<=3600) or (t>=4210 and t<=4800) or (t>=5410 and t<=6000) or (t>=7810 and t<=8400) or (t>=9010 and t<=9600) or (t>=12010 and t<=12600) or (t>=13810 and t<=14400) or (t>=15010 and t<=15600) or (t>=16210 and t<=16800) :
-            # clear weather
-            self.weather.cloudiness = CLOUDINESS_CLEAR
-            self.weather.precipitation = PRECIPITATION_CLEAR
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_CLEAR
-            self.weather.wind_intensity = WIND_INTENSITY_CLEAR
-            self.weather.fog_density = FOG_DENSITY_CLEAR
-
-        elif (t>=610 and t<=1200) or (t>=1810 and t<=2400) or (t>=4810 and t<=5400) or (t>=6610 and t<=7200) or (t>=8410 and t<=9000) or (t>=10210 and t<=10800) or (t>=11410 and t<=12000) or (t>=12610 and t<=13200) or (t>=14410 and t<=15000) or (t>=17410 and t<=18000) :
-            # rainy weather
-            self.weather.cloudiness = CLOUDINESS_RAINY
-            self.weather.precipitation = PRECIPITATION_RAINY
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_RAINY
-            self.weather.wind_intensity = WIND_INTENSITY_RAINY
-            self.weather.fog_density = FOG_DENSITY_RAINY
-
-        elif (t>=1210 and t<=1800) or (t>=2410 and t<=3000) or (t>=3610 and t<=4200) or (t>=6010 and t<=6600) or (t>=7210 and t<=7800) or (t>=9610 and t<=10200) or (t>=10810 and t<=11400) or (t>=13210 and t<=13800) or (t>=15610 and t<=16200) or (t>=16810 and t<=17400) :
-            # foggy weather
-            self.weather.cloudiness = CLOUDINESS_FOGGY
-            self.weather.precipitation = PRECIPITATION_FOGGY
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_FOGGY
-            self.weather.wind_intensity = WIND_INTENSITY_FOGGY
-            self.weather.fog_density = FOG_DENSITY_FOGGY
-
-        elif (t>600 and t<610) or (t>4800 and t<4810) or (t>8400 and t<8410) or (t>12600 and t<12610) or (t>14400 and t<14410) :
-            # transition from clear to rainy weather
-            self.weather.cloudiness = CLOUDINESS_CLEAR + (CLOUDINESS_RAINY-CLOUDINESS_CLEAR)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_CLEAR + (PRECIPITATION_RAINY-PRECIPITATION_CLEAR)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_CLEAR + (PRECIPITATION_DEPOSIT_RAINY-PRECIPITATION_DEPOSIT_CLEAR)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_CLEAR + (WIND_INTENSITY_RAINY-WIND_INTENSITY_CLEAR)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_CLEAR + (FOG_DENSITY_RAINY-FOG_DENSITY_CLEAR)*(t%10)/10
-
-        elif (t>3600 and t<3610) or (t>6000 and t<6010) or (t>9600 and t<9610) or (t>15600 and t<15610) or (t>16800 and t<16810) :
-            # transition from clear to foggy weather
-            self.weather.cloudiness = CLOUDINESS_CLEAR + (CLOUDINESS_FOGGY-CLOUDINESS_CLEAR)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_CLEAR + (PRECIPITATION_FOGGY-PRECIPITATION_CLEAR)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_CLEAR + (PRECIPITATION_DEPOSIT_FOGGY-PRECIPITATION_DEPOSIT_CLEAR)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_CLEAR + (WIND_INTENSITY_FOGGY-WIND_INTENSITY_CLEAR)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_CLEAR + (FOG_DENSITY_FOGGY-FOG_DENSITY_CLEAR)*(t%10)/10
-
-        elif (t>5400 and t<5410) or (t>9000 and t<9010) or (t>12000 and t<12010) or (t>15000 and t<15010) :
-            # transition from rainy to clear weather
-            self.weather.cloudiness = CLOUDINESS_RAINY + (CLOUDINESS_CLEAR-CLOUDINESS_RAINY)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_RAINY + (PRECIPITATION_CLEAR-PRECIPITATION_RAINY)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_RAINY + (PRECIPITATION_DEPOSIT_CLEAR-PRECIPITATION_DEPOSIT_RAINY)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_RAINY + (WIND_INTENSITY_CLEAR-WIND_INTENSITY_RAINY)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_RAINY + (FOG_DENSITY_CLEAR-FOG_DENSITY_RAINY)*(t%10)/10
-
-        elif (t>1200 and t<1210) or (t>2400 and t<2410) or (t>7200 and t<7210) or (t>10800 and t<10810) or (t>13200 and t<13210) :
-            # transition from rainy to foggy weather
-            self.weather.cloudiness = CLOUDINESS_RAINY + (CLOUDINESS_FOGGY-CLOUDINESS_RAINY)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_RAINY + (PRECIPITATION_FOGGY-PRECIPITATION_RAINY)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_RAINY + (PRECIPITATION_DEPOSIT_FOGGY-PRECIPITATION_DEPOSIT_RAINY)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_RAINY + (WIND_INTENSITY_FOGGY-WIND_INTENSITY_RAINY)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_RAINY + (FOG_DENSITY_FOGGY-FOG_DENSITY_RAINY)*(t%10)/10
-
-        elif (t>3000 and t<3010) or (t>4200 and t<4210) or (t>7800 and t<7810) or (t>13800 and t<13810) or (t>16200 and t<16210) :
-            # transition from foggy to clear weather
-            self.weather.cloudiness = CLOUDINESS_FOGGY + (CLOUDINESS_CLEAR-CLOUDINESS_FOGGY)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_FOGGY + (PRECIPITATION_CLEAR-PRECIPITATION_FOGGY)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_FOGGY + (PRECIPITATION_DEPOSIT_CLEAR-PRECIPITATION_DEPOSIT_FOGGY)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_FOGGY + (WIND_INTENSITY_CLEAR-WIND_INTENSITY_FOGGY)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_FOGGY + (FOG_DENSITY_CLEAR- FOG_DENSITY_FOGGY)*(t%10)/10
-
-        elif (t>1800 and t<1810) or (t>6600 and t<6610) or (t>10200 and t<10210) or (t>11400 and t<11410) or (t>17400 and t<17410) :
-            # transition from foggy to rainy weather
-            self.weather.cloudiness = CLOUDINESS_FOGGY + (CLOUDINESS_RAINY-CLOUDINESS_FOGGY)*(t%10)/10
-            self.weather.precipitation = PRECIPITATION_FOGGY + (PRECIPITATION_RAINY-PRECIPITATION_FOGGY)*(t%10)/10
-            self.weather.precipitation_deposits = PRECIPITATION_DEPOSIT_FOGGY + (PRECIPITATION_DEPOSIT_RAINY-PRECIPITATION_DEPOSIT_FOGGY)*(t%10)/10
-            self.weather.wind_intensity = WIND_INTENSITY_FOGGY + (WIND_INTENSITY_RAINY-WIND_INTENSITY_FOGGY)*(t%10)/10
-            self.weather.fog_density =  FOG_DENSITY_FOGGY + (FOG_DENSITY_RAINY- FOG_DENSITY_FOGGY)*(t%10)/10
+        values = get_weather_values(t)
+        if values is None:
+            return
+        for name, value in zip(VARYING_PARAMETERS, values):
+            setattr(self.weather, name, value)
+
+
+
+def main():
+    """Computes the weather.json file of a sequence from its timestamp"""
+    parser = argparse.ArgumentParser(description="Computes the weather.json file of a sequence offline.")
+    parser.add_argument("sequence", help="path to the sequence folder.")
+    parser.add_argument("--hz", type=float, default=10, help="simulation frequency used for the sequence (default: 10).")
+    parser.add_argument("--fps", type=int, default=1, help="number of frames acquired per second (default: 1).")
+    parser.add_argument("--discard-duration", type=float, default=3.0, help="duration discarded before the record (default: 3.0).")
+    parser.add_argument("--nb_frames", type=int, default=None, help="number of frames (default: number of frames of gnss.json).")
+    parser.add_argument("--output", type=str, default=None, help="output file (default: weather.json in the sequence folder).")
+    args = parser.parse_args()
+
+    sequence_name = os.path.basename(os.path.abspath(args.sequence))
+    with open(os.path.join(args.sequence, sequence_name + ".json")) as fp:
+        metadata = json.load(fp)
+    seq_timestamp = metadata["timestamp"]
+    nb_frames = args.nb_frames
+    if nb_frames is None:
+        with open(os.path.join(args.sequence, "gnss.json")) as fp:
+            nb_frames = len(json.load(fp))
+
+    # The timestamps of the frames are saved in ego_state.json by the generation (the released sequences
+    # do not have this file: the timestamps are computed from the generation settings)
+    ego_state_path = os.path.join(args.sequence, "ego_state.json")
+    if os.path.isfile(ego_state_path):
+        with open(ego_state_path) as fp:
+            ego_state = json.load(fp)
+        frames = sorted(int(frame) for frame in ego_state)[:nb_frames]
+        timestamps = np.array([ego_state[str(frame)]["timestamp"] for frame in frames], dtype=np.float64)
+    else:
+        if metadata.get("capture_mode") == "recorded":
+            print("Warning: no ego_state.json, the timestamps of the frames captured with --capture-mode recorded are approximate.")
+        frames = list(range(1, nb_frames + 1))
+        timestamps = get_frame_timestamps(seq_timestamp, nb_frames, args.hz, args.fps, args.discard_duration, metadata.get("skipped_frames", ()))
+
+    timeline = get_weather_timeline(timestamps)
+    # The values are rounded as single-precision floats, as they are stored by carla.WeatherParameters
+    columns = [timeline[name].astype(np.float32).astype(np.float64).tolist() for name in WEATHER_JSON_PARAMETERS]
+    weather_dic = {frame: dict(zip(WEATHER_JSON_PARAMETERS, values)) for frame, values in zip(frames, zip(*columns))}
+
+    output = args.output if args.output is not None else os.path.join(args.sequence, "weather.json")
+    with open(output, 'w') as fp:
+        json.dump(weather_dic, fp, sort_keys=True, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,62 +8,73 @@ This code was inspired by the one of the SLED dataset (https://github.com/vbrebi
 itself inspired by the one of Cooperative Driving Dataset (https://github.com/eduardohenriquearnold/CODD).
 """
 
-import random
-
 import carla
 import numpy as np
-import queue
+
+from phase_timer import PhaseTimer
+from sensor_sync import SensorSynchronizer
 
 
 class EgoVehicle:
-  """The ego-vehicle, which carries all the sensors for the recording"""
+  """An ego-vehicle, which carries all the sensors for the recording of a sequence"""
 
-  # Class variable, which stores the reference to the unique instance (we want a single ego-vehicle)
-  instance = None
+  # Class variable, that stores the reference to all the instances (one per recorded sequence)
+  instances = []
 
 
   def __init__(self, transform, world, traffic_manager, args):
     """
-    Checks first if no other ego-vehicle has already been spawned.
-    Then, tries to spawn the ego-vehicle at the given transform (may fail due to collision).
-    If it succeeds, then adds all sensors to the vehicle, and sets the instance.
+    Tries to spawn the ego-vehicle at the given transform (may fail due to collision).
+    If it succeeds, then adds all sensors to the vehicle, and adds it to the instances list.
     """
 
-    # We first check if no other ego-vehicle has already been spawned
-    if EgoVehicle.instance is not None:
-      raise Exception("An ego-vehicle already exists, no new ego-vehicle should be spawned!")
-
-    # We set the random seed
-    random.seed = args.seed
-
     # We try to spawn the ego-vehicle and to configure it
     self.world = world
     self.traffic_manager = traffic_manager
     vehicle_blueprint = world.get_blueprint_library().find('vehicle.tesla.model3')
-    vehicle_blueprint.set_attribute('role_name', 'hero')
+    vehicle_blueprint.set_attribute('role_name', 'hero') # In large maps, tiles are loaded around every hero vehicle
     self.vehicle = world.try_spawn_actor(vehicle_blueprint, transform)
     if self.vehicle is None:
       raise Exception("Unable to spawn the ego-vehicle at the given transform!")
-    self.vehicle.set_autopilot(True, traffic_manager.get_port())
-    self.vehicle.set_simulate_physics(True)
-    self.traffic_manager.update_vehicle_lights(self.vehicle, True)
-
-    # We create the queue which will hold data from the sensors
-    self._queues = []
-    self._settings = None
 
-    # We spawn the RGB camera
-    rgb_transform = carla.Transform(carla.Location(x=1, z=1.2))
-    self.rgb = world.spawn_actor(self.get_rgb_bp(args), rgb_transform, attach_to=self.vehicle)
-
-    # We spawn the semantic camera
-    self.semantic = world.spawn_actor(self.get_semantic_bp(args), rgb_transform, attach_to=self.vehicle)
-
-    # We spawn the gnss sensor
-    self.gnss = world.spawn_actor(self.get_gnss_bp(args), carla.Transform(), attach_to=self.vehicle)
+    # If the ego-vehicle cannot be configured, or one of its sensors cannot be spawned, the actors spawned
+    # so far are destroyed
+    self.rgb = self.semantic = self.gnss = None
+    try:
+      self.vehicle.set_autopilot(True, traffic_manager.get_port())
+      self.vehicle.set_simulate_physics(True)
+      self.traffic_manager.update_vehicle_lights(self.vehicle, True)
+
+      # The synchronizer which will hold data from the sensors is created by create_queue
+      self.sync = None
+      self._settings = None
+
+      # The durations of the phases of the recording of the sequence (sensor waits, saves...)
+      self.timer = PhaseTimer()
+
+      # When the cameras only capture the recorded frames, their images are paired with the data of the
+      # other sensors as they arrive
+      self.capture_mode = args.capture_mode
+      self._ticks_per_frame = max(1, int(max(args.hz, args.fps)/args.fps))
+      self._pending_ticks = {}
+
+      # We spawn the RGB camera
+      rgb_transform = carla.Transform(carla.Location(x=1, z=1.2))
+      self.rgb = world.spawn_actor(self.get_rgb_bp(args), rgb_transform, attach_to=self.vehicle)
+
+      # We spawn the semantic camera
+      self.semantic = world.spawn_actor(self.get_semantic_bp(args), rgb_transform, attach_to=self.vehicle)
+
+      # We spawn the gnss sensor
+      self.gnss = world.spawn_actor(self.get_gnss_bp(args), carla.Transform(), attach_to=self.vehicle)
+    except BaseException:
+      for actor in [self.gnss, self.semantic, self.rgb, self.vehicle]:
+        if actor is not None:
+          actor.destroy()
+      raise
 
     # We register the instance
-    EgoVehicle.instance = self
+    EgoVehicle.instances.append(self)
 
 
 
@@ -76,7 +87,7 @@ class EgoVehicle:
     bp.set_attribute("fov", args.rgb_fov)
     bp.set_attribute("enable_postprocess_effects", "True") # A set of post-process effects is applied to the image for the sake of realism
     bp.set_attribute("gamma", "2.2") # See https://github.com/carla-simulator/carla/issues/6103
-    bp.set_attribute("sensor_tick", "0") # sensor_tick = 0 means as fast as possible
+    bp.set_attribute("sensor_tick", self.get_camera_sensor_tick(args))
     return bp
 
 
@@ -88,11 +99,19 @@ class EgoVehicle:
     bp.set_attribute("image_size_x", rgb_resolution[0])
     bp.set_attribute("image_size_y", rgb_resolution[1])
     bp.set_attribute("fov", args.rgb_fov)
-    bp.set_attribute("sensor_tick", "0") # sensor_tick = 0 means as fast as possible
+    bp.set_attribute("sensor_tick", self.get_camera_sensor_tick(args))
     return bp
 
 
 
+  def get_camera_sensor_tick(self, args):
+    """Gets the sensor_tick of the cameras, depending on the capture mode"""
+    if args.capture_mode == "recorded":
+      return str(1.0/args.fps) # The cameras only render and send the frames at the recording frequency
+    return "0" # sensor_tick = 0 means as fast as possible
+
+
+
   def get_gnss_bp(self, args):
     """Gets and configures the RGB camera blueprint"""
     bp = self.world.get_blueprint_library().find("sensor.other.gnss")
@@ -108,40 +127,102 @@ class EgoVehicle:
       synchronous_mode=True,
       fixed_delta_seconds=1.0/args.hz))
 
-    def make_queue(register_event):
-      q = queue.Queue()
-      register_event(q.put)
-      self._queues.append(q)
-
-    make_queue(self.world.on_tick)
-    for sensor in [self.rgb, self.semantic, self.gnss]:
-      make_queue(sensor.listen)
+    # The data of the sensors are matched by frame id, waiting at most the given timeouts for each sensor
+    self.sync = SensorSynchronizer({"world":args.sensor_timeout, "rgb":args.camera_timeout,
+                                    "semantic":args.camera_timeout, "gnss":args.sensor_timeout},
+                                   missing_frame_policy=args.missing_frame_policy)
+    self._on_tick_id = self.world.on_tick(self.sync.callback("world"))
+    self.rgb.listen(self.sync.callback("rgb"))
+    self.semantic.listen(self.sync.callback("semantic"))
+    self.gnss.listen(self.sync.callback("gnss"))
     return self
 
 
 
   def get_sync_data(self, frame):
-    """Get the synchronized data for each sensor"""
+    """
+    Get the synchronized data for each sensor. (carla.SensorData.frame returns the frame count when the
+    data was generated, all the data returned were thus generated at the same time.)
+    Returns None if the data of a sensor were not received in time, in which case the frame is skipped.
+    """
     self.frame = frame 
-    data = [self._retrieve_data(q) for q in self._queues]
-    assert all(x.frame == self.frame for x in data) # Checks that the data coming from sensors were generating at the same time. (carla.SensorData.frame returns the frame count when the data was generated.)
-    location = self.vehicle.get_location()
-    data.append(location)
+    with self.timer.measure("sensor_wait"):
+      data = self.sync.get(frame, ["world", "rgb", "semantic", "gnss"])
+    if data is None:
+      return None
+    data.append(self.get_state(data[0]))
     return data
 
 
 
-  def _retrieve_data(self, sensor_queue):
-    while True:
-      data = sensor_queue.get()
-      if data.frame == self.frame: # Checks that the data coming from sensors were generating at the same time. (carla.SensorData.frame returns the frame count when the data was generated.)
-        return data
+  def get_state(self, snapshot):
+    """
+    Gets the state of the ego-vehicle (location, rotation, velocity, acceleration, angular velocity) at
+    the frame of a carla.WorldSnapshot, as saved in ego_state.json. The snapshot already holds the state
+    of all the actors, so that no request is sent to the simulator.
+    """
+    actor = snapshot.find(self.vehicle.id)
+    if actor is None:
+      # We should not get there, but the state can still be requested to the simulator
+      actor = self.vehicle
+    transform = actor.get_transform()
+    velocity = actor.get_velocity()
+    acceleration = actor.get_acceleration()
+    angular_velocity = actor.get_angular_velocity()
+    return {"frame":snapshot.frame, "elapsed_seconds":snapshot.timestamp.elapsed_seconds,
+            "location":{"x":transform.location.x, "y":transform.location.y, "z":transform.location.z},
+            "rotation":{"pitch":transform.rotation.pitch, "yaw":transform.rotation.yaw, "roll":transform.rotation.roll},
+            "velocity":{"x":velocity.x, "y":velocity.y, "z":velocity.z},
+            "acceleration":{"x":acceleration.x, "y":acceleration.y, "z":acceleration.z},
+            "angular_velocity":{"x":angular_velocity.x, "y":angular_velocity.y, "z":angular_velocity.z}}
+
+
+
+  def get_captured_data(self, frame, tick_data=None):
+    """
+    Used when the cameras only capture the recorded frames (capture_mode "recorded").
+    Gets the data of the world and of the GNSS for the given frame, which are sent on every tick, and
+    returns the list of frames for which the images of both cameras have been received since the last
+    call. For each of these frames, the data of all sensors come from the same frame, followed by the
+    tick_data given when this frame was ticked.
+    """
+    self.frame = frame
+    with self.timer.measure("sensor_wait"):
+      data = self.sync.get(frame, ["world", "gnss"])
+    if data is not None:
+      snapshot, gnss_data = data
+      self._pending_ticks[frame] = (snapshot, gnss_data, self.get_state(snapshot), tick_data)
+
+    # We pair the images received so far with the data of the ticks
+    with self.timer.measure("image_poll"):
+      self.sync.poll()
+    captures = []
+    for captured_frame in sorted(self._pending_ticks):
+      images = self.sync.take(captured_frame, ["rgb", "semantic"])
+      if images is not None:
+        snapshot, gnss_data, state, tick_data = self._pending_ticks[captured_frame]
+        captures.append([snapshot, images[0], images[1], gnss_data, state, tick_data])
+
+    # We forget the data which can no longer be paired: the ticks before the last capture, and the
+    # ticks (and images) older than a few recording periods
+    oldest_frame = frame - 2*self._ticks_per_frame
+    if captures:
+      oldest_frame = max(oldest_frame, captures[-1][0].frame + 1)
+    for old_frame in [f for f in self._pending_ticks if f < oldest_frame]:
+      del self._pending_ticks[old_frame]
+    self.sync.discard_before(oldest_frame, ["rgb", "semantic"])
+    return captures
 
 
 
   def destroy(self):
-    """Destroys the sensors and the ego-vehicle"""
+    """Destroys the sensors and the ego-vehicle, so that a new ego-vehicle can be spawned"""
+    if self.sync is not None:
+      self.world.remove_on_tick(self._on_tick_id)
+      for sensor in [self.rgb, self.semantic, self.gnss]:
+        sensor.stop()
     self.rgb.destroy()
     self.semantic.destroy()
     self.gnss.destroy()
     self.vehicle.destroy()
+    EgoVehicle.instances.remove(self)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+FrameWriter class definition.
+
+The images of the sensors are copied out of the CARLA objects and handed to a pool of threads, which
+encode and save them to disk while the simulation goes on. The queue of pending images is bounded,
+so that the simulation waits for the disks (instead of filling the memory) if they are too slow.
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+from PIL import Image
+
+from phase_timer import PhaseTimer
+from semantic_labels import CARLA_PALETTE, DADE_PALETTE, carla_to_dade
+
+
+class FrameWriter:
+  """A pool of threads saving the RGB images and semantic segmentation ground truths to disk"""
+
+  def __init__(self, nb_workers=2, queue_size=8):
+    """Starts the threads, which wait for images to save"""
+    self._queue = queue.Queue(maxsize=queue_size)
+    self._lock = threading.Lock()
+
+    # Counters, to size the pool and the queue
+    self.nb_submitted = 0
+    self.nb_written = 0
+    self.nb_stalled = 0 # Images for which the simulation had to wait for a free slot in the queue
+    self.nb_dropped = 0 # Images which could not be saved
+    self.max_queue_depth = 0
+
+    # The durations of the encoding and saving of the images, by type of image
+    self.timer = PhaseTimer()
+
+    self._workers = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, nb_workers))]
+    for worker in self._workers:
+      worker.start()
+
+
+
+  def save_rgb(self, image, path):
+    """Saves a carla.Image from the RGB camera as a png file"""
+    self._submit(_save_rgb, _copy_image(image), path, "write_rgb")
+
+
+
+  def save_semantic(self, image, carla_path=None, dade_path=None, npz_path=None):
+    """
+    Saves a carla.Image from the semantic camera, from the same buffer of tags:
+    - as a png file using the CityScapesPalette (carla_path);
+    - with the reduced DADE labels, as a png file (dade_path) and as a npz file of IDs (npz_path).
+    """
+    self._submit(_save_semantic, _copy_tags(image), (carla_path, dade_path, npz_path), "write_semantic")
+
+
+
+  def stats(self):
+    """Gets the counters of the writer"""
+    return {"submitted":self.nb_submitted, "written":self.nb_written, "stalled":self.nb_stalled,
+            "dropped":self.nb_dropped, "queue_depth":self._queue.qsize(), "max_queue_depth":self.max_queue_depth}
+
+
+
+  def close(self):
+    """Waits for all the pending images to be saved, and stops the threads"""
+    for _ in self._workers:
+      self._queue.put(None)
+    for worker in self._workers:
+      worker.join()
+
+
+
+  def _submit(self, function, array, path, phase):
+    job = (function, array, path, phase)
+    try:
+      self._queue.put_nowait(job)
+    except queue.Full:
+      self.nb_stalled += 1
+      self._queue.put(job)
+    self.nb_submitted += 1
+    self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+
+
+  def _run(self):
+    while True:
+      job = self._queue.get()
+      if job is None:
+        return
+      function, array, path, phase = job
+      try:
+        with self.timer.measure(phase):
+          function(array, path)
+        with self._lock:
+          self.nb_written += 1
+      except Exception as e:
+        print(f"Unable to save {path}: {e}")
+        with self._lock:
+          self.nb_dropped += 1
+
+
+
+def _copy_image(image):
+  """Copies the BGRA buffer of a carla.Image to a numpy array"""
+  return np.frombuffer(image.raw_data, dtype=np.uint8).reshape((image.height, image.width, 4)).copy()
+
+
+
+def _copy_tags(image):
+  """Copies the tags of a carla.Image from the semantic camera, stored in the red channel of its BGRA buffer"""
+  return np.frombuffer(image.raw_data, dtype=np.uint8).reshape((image.height, image.width, 4))[:, :, 2].copy()
+
+
+
+def _save_png(array, path, mode="RGBA"):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  Image.fromarray(array, mode).save(path)
+
+
+
+def _save_rgb(bgra, path):
+  _save_png(bgra[:, :, [2, 1, 0, 3]], path)
+
+
+
+def _save_semantic(tags, paths):
+  carla_path, dade_path, npz_path = paths
+  if carla_path is not None:
+    rgba = np.full(tags.shape + (4,), 255, dtype=np.uint8)
+    rgba[:, :, :3] = CARLA_PALETTE[tags]
+    _save_png(rgba, carla_path)
+  if dade_path is not None or npz_path is not None:
+    ids = carla_to_dade(tags)
+    if dade_path is not None:
+      _save_png(DADE_PALETTE[ids], dade_path, "RGB")
+    if npz_path is not None:
+      os.makedirs(os.path.dirname(npz_path), exist_ok=True)
+      np.savez_compressed(npz_path, ids)
@@ -16,9 +16,13 @@ itself inspired by the one of Cooperative Driving Dataset (https://github.com/ed
 import argparse
 import csv
 from datetime import datetime
+import json
+import os
 from os.path import exists
 import random
+import shutil
 import subprocess
+import threading
 
 
 def parse_args():
@@ -54,9 +58,137 @@ def parse_args():
     type=str,
     default="dataset",
     help="Path to the folder where generated sequences will be saved (default: dataset)")
+  argparser.add_argument(
+    "--endpoints",
+    type=str,
+    default="localhost:2000:8000",
+    help="Comma-separated list of the CARLA servers to use in parallel, each given as host:port:traffic_manager_port (default: localhost:2000:8000)")
+  argparser.add_argument(
+    "--max_retries",
+    type=int,
+    default=2,
+    help="Number of times a failed sequence is generated again, on another server if possible (default: 2)")
+  argparser.add_argument(
+    "--script",
+    type=str,
+    default="generate_sequence.py",
+    help="Script generating a single sequence (default: generate_sequence.py)")
   return argparser.parse_args()
 
 
+def parse_endpoints(endpoints):
+  """Parses a list of host:port:traffic_manager_port endpoints"""
+  parsed = []
+  for endpoint in endpoints.split(","):
+    host, port, traffic_manager_port = endpoint.strip().rsplit(":", 2)
+    parsed.append((host, int(port), int(traffic_manager_port)))
+  return parsed
+
+
+
+def list_folders(output_folder):
+  """Gets the names of the folders of the output folder"""
+  if not exists(output_folder):
+    return set()
+  return set(name for name in os.listdir(output_folder) if os.path.isdir(os.path.join(output_folder, name)))
+
+
+
+def remove_failed_attempt(output_folder, names, seed):
+  """
+  Removes the sequence folders left by a failed generation with the given seed: among the given folders
+  (the ones created during the generation, as other generations may write in the same output folder),
+  the ones whose json file has this seed and was never completed (seq_length still "NaN"). Their rows are
+  not in the csv file, which only lists the complete sequences. Returns the names of the removed folders.
+  """
+  removed = []
+  for name in sorted(names):
+    metadata_path = os.path.join(output_folder, name, name + ".json")
+    try:
+      with open(metadata_path) as fp:
+        metadata = json.load(fp)
+    except (OSError, ValueError):
+      continue
+    if metadata.get("seed") != seed or metadata.get("seq_length") != "NaN":
+      continue
+    shutil.rmtree(os.path.join(output_folder, name))
+    removed.append(name)
+  return removed
+
+
+
+class SequenceScheduler:
+  """Distributes the sequences to generate over a pool of CARLA servers"""
+
+  def __init__(self, endpoints, run_job, max_retries=2):
+    """
+    endpoints is a list of (host, port, traffic_manager_port) tuples, each running one sequence at a time.
+    run_job(job, endpoint) generates a sequence on an endpoint and returns True if it succeeded.
+    """
+    self.endpoints = endpoints
+    self.run_job = run_job
+    self.max_retries = max_retries
+    self._condition = threading.Condition()
+    self._pending = []
+    self._running = 0
+    self.succeeded = []
+    self.failed = []
+
+
+
+  def run(self, jobs):
+    """Generates all the jobs, and returns the list of jobs which failed after all retries"""
+    self._pending = [{"job":job, "attempts":0, "tried":set()} for job in jobs]
+    threads = [threading.Thread(target=self._worker, args=(endpoint,)) for endpoint in self.endpoints]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return self.failed
+
+
+
+  def _next_task(self, endpoint):
+    """Waits for a job that this endpoint should run. Returns None when all the jobs are done."""
+    with self._condition:
+      while True:
+        for task in self._pending:
+          # A job that failed on an endpoint is retried on the other ones first
+          if endpoint not in task["tried"] or len(task["tried"]) >= len(self.endpoints):
+            self._pending.remove(task)
+            self._running += 1
+            return task
+        if not self._pending and self._running == 0:
+          return None
+        self._condition.wait()
+
+
+
+  def _worker(self, endpoint):
+    while True:
+      task = self._next_task(endpoint)
+      if task is None:
+        return
+      task["attempts"] += 1
+      try:
+        success = self.run_job(task["job"], endpoint)
+      except Exception as e:
+        print(f"Sequence {task['job']} raised an exception on {endpoint}: {e}")
+        success = False
+      with self._condition:
+        self._running -= 1
+        if success:
+          self.succeeded.append(task["job"])
+        elif task["attempts"] <= self.max_retries:
+          print(f"Sequence {task['job']} failed on {endpoint}, it will be generated again.")
+          task["tried"].add(endpoint)
+          self._pending.append(task)
+        else:
+          print(f"Sequence {task['job']} failed {task['attempts']} times, giving up.")
+          self.failed.append(task["job"])
+        self._condition.notify_all()
+
+
 def main():
   """Main function"""
 
@@ -71,13 +203,14 @@ def main():
   # We initialize the list of maps
   maps = [f"Town0{i}" for i in range(1, 8)] + ["Town10HD"] + ["Town12"]
 
-  # For each of the N sequences...
-  for i in range(nb_seq_to_generate):
-    # Display progress to the user
-    print(f"Generating sequence {i+1}/{nb_seq_to_generate}...")
+  # We select a base seed based on current date and time. Each sequence gets its own seed, as several
+  # sequences may be started during the same second when they are generated in parallel.
+  base_seed = int(datetime.now().strftime("%Y%m%d%H%M%S")) * 1000
 
-    # We select a seed based on current date and time, and select a map based on it if no map was chosen.
-    seed = datetime.now().strftime("%Y%m%d_%H%M%S")
+  # We prepare the N sequences, selecting a map based on the seed if no map was chosen
+  jobs = []
+  for i in range(nb_seq_to_generate):
+    seed = base_seed + i
     random.seed(seed)
     if args.map != "":
       map = args.map
@@ -85,16 +218,35 @@ def main():
         raise Exception(f"Map {map} is not part of the list of maps!")
     else:
       map = random.choice(maps)
+    jobs.append({"index":i+1, "map":map, "seed":seed})
 
-    # We set the adequate output folder and csv file names
-    output_folder = f"{args.output_folder}"
-    csv_file = f"{args.output_folder}/metadata.csv"
+  # We set the adequate output folder and csv file names
+  output_folder = f"{args.output_folder}"
+  csv_file = f"{args.output_folder}/metadata.csv"
 
-    # And we finally call the sequence generation script with the args
-    subprocess.run(["python3", "generate_sequence.py", "--map", map, "--seed", seed, 
+  def run_job(job, endpoint):
+    """Calls the sequence generation script with the args, on the given CARLA server"""
+    host, port, traffic_manager_port = endpoint
+    # Display progress to the user
+    print(f"Generating sequence {job['index']}/{nb_seq_to_generate} on {host}:{port}...")
+    folders_before = list_folders(output_folder)
+    result = subprocess.run(["python3", args.script, "--host", host, "--port", str(port),
+      "--traffic-manager-port", str(traffic_manager_port), "--map", job["map"], "--seed", str(job["seed"]),
       "--fps", str(fps), "--nb_frames", str(nb_frames_in_seq), "--npedestrians", str(0),
-      "--dynamic_weather", str(dynamic_weather), "--output_folder", output_folder, "--csv_file", csv_file], check=True)
-
+      "--dynamic_weather", str(dynamic_weather), "--output_folder", output_folder, "--csv_file", csv_file])
+    if result.returncode != 0:
+      # The partial sequence is removed, so that only the complete sequences are left in the dataset
+      removed = remove_failed_attempt(output_folder, list_folders(output_folder) - folders_before, job["seed"])
+      if removed:
+        print(f"Removed the partial sequence(s) {', '.join(removed)} of sequence {job['index']}.")
+      return False
+    return True
+
+  # And we finally generate the sequences on the pool of CARLA servers
+  scheduler = SequenceScheduler(parse_endpoints(args.endpoints), run_job, args.max_retries)
+  failed = scheduler.run(jobs)
+  if failed:
+    raise Exception(f"{len(failed)}/{nb_seq_to_generate} sequences could not be generated: {failed}")
 
 if __name__ == "__main__":
   main()
@@ -4,49 +4,46 @@
 """
 This script can be used to generate a single sequence in the CARLA simulator, containing:
 - images from a RGB camera (.png);
-- semantic segmentation ground truths (.png);
-- geolocalisation data (.json).
-The sequence is saved in a folder.
+- semantic segmentation ground truths, with the CARLA and DADE labels (.png, .npz);
+- geolocalisation data and state of the ego-vehicle (.json).
+The sequence is saved in a folder. Several ego-vehicles can record a sequence each in the same simulation.
 
 This code was inspired by the one of the SLED dataset (https://github.com/vbrebion/SLED), 
 itself inspired by the one of Cooperative Driving Dataset (https://github.com/eduardohenriquearnold/CODD).
 """
 
-import csv
 import random
-from time import sleep
-from datetime import datetime
-import os
+from time import perf_counter, sleep
 
 import carla
-import json
 from tqdm import tqdm
 
 from ai_pedestrian import AIPedestrian
-from ai_vehicle import AIVehicle
 from ego_vehicle import EgoVehicle
-from dynamic_weather import Weather
+from dynamic_weather import Weather, WEATHER_JSON_PARAMETERS
+from frame_writer import FrameWriter
 from generate_sequence_args import parse_args
+from phase_timer import PhaseTimer
+from population import Population
+from sequence_recorder import SequenceRecorder
+from world_state import WorldStateSync
 
 
-def main():
-  """Main function"""
+def setup_world(client, args):
+  """Loads the map, and configures the simulation and the traffic manager"""
 
-  # We begin by collecting the command-line args
-  args = parse_args()
-  hz = args.hz
-  if args.hz < args.fps:
-    hz = args.fps
+  # We load the correct map
+  world = client.load_world(args.map)
+  traffic_manager = configure_simulation(client, world, args)
+  return world, traffic_manager
 
-  # We set the random seed
-  random.seed(args.seed)
 
-  # We connect to the CARLA simulator
-  client = carla.Client(args.host, args.port)
-  client.set_timeout(300.0)
 
-  # We load the correct map
-  world = client.load_world(args.map)
+def configure_simulation(client, world, args):
+  """Applies the simulation settings and configures the traffic manager (seeded with args.seed)"""
+  hz = args.hz
+  if args.hz < args.fps:
+    hz = args.fps
 
   # We apply the simulation settings
   settings = world.get_settings()
@@ -66,7 +63,21 @@ def main():
   if args.map == "Town12":
     traffic_manager.set_respawn_dormant_vehicles(True) # This enables respawning of dormant vehicles within 100 and 500 meters of the hero vehicle
     traffic_manager.set_boundaries_respawn_dormant_vehicles(100,500)
+  return traffic_manager
+
+
+
+def generate_sequence(client, world, traffic_manager, args):
+  """
+  Generates a sequence for each ego-vehicle (args.nb_egos) in a world configured by
+  configure_simulation, and removes all the actors at the end. Returns the names of the sequence folders.
+  """
+  hz = args.hz
+  if args.hz < args.fps:
+    hz = args.fps
 
+  # We set the random seed
+  random.seed(args.seed)
 
   # We configure the time and weather settings
   # We draw a random timestamp 
@@ -75,156 +86,215 @@ def main():
     seq_timestamp = 0
   elif seq_timestamp > 16199 :
     seq_timestamp = 16199
+  # We initialize the timer for the sequence (the timestamp of each saved frame is seq_timestamp+elapsed_time)
+  elapsed_time = 0.0
   dynamic_weather = args.dynamic_weather
   if dynamic_weather == 'True' or dynamic_weather == 'true': 
     print('The weather is dynamic.')
     # We instantiate a Weather class
     weather = Weather(world.get_weather(), seq_timestamp)
-    world.set_weather(weather.weather)
-    # We initialize the timer for the sequence
-    elapsed_time = 0.0
-    # We get the light manager
-    light_manager = world.get_lightmanager()
+    # We push the weather (and the lights) to the simulator only when they change
+    world_state = WorldStateSync(world, args.light_refresh_ticks, args.sun_tolerance)
+    world_state.update(weather.weather)
   else : # If the weather is fixed
     weather = carla.WeatherParameters.ClearNoon
     weather.sun_altitude_angle = args.sun_altitude
     weather.cloudiness = args.cloudiness
     world.set_weather(weather)
 
-  # We spawn the ego-vehicle
-  ego_vehicle_transform = random.choice(world.get_map().get_spawn_points())
-  ego_vehicle = EgoVehicle(ego_vehicle_transform, world, traffic_manager, args)
-
-  # We spawn the other AI-controlled vehicles
-  while(len(AIVehicle.instances) < args.nvehicles):
-    vehicle_transform = random.choice(world.get_map().get_spawn_points())
-    AIVehicle(vehicle_transform, world, traffic_manager, args)
-
-  # We spawn the AI-controlled pedestrians
-  while(len(AIPedestrian.instances) < args.npedestrians):
-    pedestrian_location = world.get_random_location_from_navigation()
-    pedestrian_transform = carla.Transform(location=pedestrian_location)
-    AIPedestrian(pedestrian_transform, world, args)
-
   # We compute the number of world ticks we have to discard and to record, based on the durations
   # given by the user
   ticks_to_discard = int(args.discard_duration * hz)
   ticks_to_record = int(args.nb_frames * hz / args.fps)
 
-  # We create the queues, which will hold the numpy arrays of data before saving them to disk
-  rgb_images_queue = []
-  semantic_images_queue = []
-  gnss_dic = {}
-  weather_dic = {}
-
   nb_frames_saved = 0
-  dir_name = 1
   save_frame = False
   counter_frame = 0
-  folder_name = str(datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
-  
-  # Save metadata in csv file
-  with open(args.csv_file, 'a', newline='') as csv_file:
-      csv_writer = csv.writer(csv_file, delimiter=';')
-      csv_writer.writerow([folder_name, args.map, args.seed, args.dynamic_weather, args.sun_altitude, args.cloudiness, args.nvehicles, args.npedestrians, seq_timestamp])
-      csv_file.close()
-
-  # Save metadata of the sequence in json file
-  if not os.path.exists('{}/{}'.format(args.output_folder, folder_name)):
-    os.makedirs('{}/{}'.format(args.output_folder, folder_name))
-  dic = {"timestamp":seq_timestamp, "map":args.map, "seed":args.seed, "dynamic_weather":args.dynamic_weather, "nb_vehicles":args.nvehicles, "nb_pedestrians":args.npedestrians, "seq_length":"NaN"}
-  with open('{}/{}/{}.json'.format(args.output_folder, folder_name, folder_name), 'w') as fp:
-    json.dump(dic, fp, indent=4)
 
+  # We start the threads which save the images to disk
+  frame_writer = FrameWriter(args.writer_workers, args.writer_queue_size)
+
+  # The durations of the phases of the simulation loop, shared by the sequences (see SequenceRecorder.write_timing)
+  timer = PhaseTimer()
 
+  def get_weather_record():
+    """Gets the current weather parameters, as saved in weather.json"""
+    if dynamic_weather == 'True' or dynamic_weather == 'true':
+      return {name:getattr(weather.weather, name) for name in WEATHER_JSON_PARAMETERS}
+    return None
+
+
+  # The actors are spawned in the try block, so that they are removed from the simulation even if one
+  # of them cannot be spawned
+  population = Population(client, world, traffic_manager, args)
+  recorders = []
+
+  # The sequences are only added to the csv file if the recording completed
+  completed = False
   try:
+    # We spawn the ego-vehicles, at different spawn points
+    spawn_points = world.get_map().get_spawn_points()
+    free_spawn_points = list(spawn_points)
+    for _ in range(args.nb_egos):
+      ego_vehicle_transform = random.choice(free_spawn_points)
+      free_spawn_points.remove(ego_vehicle_transform)
+      EgoVehicle(ego_vehicle_transform, world, traffic_manager, args)
+
+    # We spawn the other AI-controlled vehicles and the AI-controlled pedestrians, by batches
+    population.spawn_vehicles(args.nvehicles, free_spawn_points)
+    population.spawn_pedestrians(args.npedestrians)
+
+    # Each ego-vehicle records its own sequence, in its own folder
+    recorders = [SequenceRecorder(ego_vehicle, frame_writer, seq_timestamp, args) for ego_vehicle in EgoVehicle.instances]
+
     # We compute a first world tick, after which we can enable the controller of the pedestrians
     world.tick()
     for pedestrian in AIPedestrian.instances:
       pedestrian.start_controller()
 
-    ego_vehicle.create_queue(args)
+    for ego_vehicle in EgoVehicle.instances:
+      ego_vehicle.create_queue(args)
 
     # We loop a first time, to skip the first world ticks that should be discarded
     for _ in tqdm(range(ticks_to_discard), "Discarding ticks"):
       frame = world.tick()
+      elapsed_time += 1.0/hz
 
       # We already update the weather and light status so that when we record the first frame, it's ready
       if dynamic_weather == 'True' or dynamic_weather == 'true': # We update the weather 
-        elapsed_time += 1.0/hz
         if seq_timestamp+elapsed_time > 18000:
           break
         weather.tick(seq_timestamp+elapsed_time)
-        world.set_weather(weather.weather)
-        # We turn off or on the lights depending on the sun altitude angle
-        if weather.weather.sun_altitude_angle < 1 :
-          light_manager.set_active(light_manager.get_all_lights(), [True for i in range(len(light_manager.get_all_lights()))])
-        else :
-          light_manager.set_active(light_manager.get_all_lights(), [False for i in range(len(light_manager.get_all_lights()))])
+        world_state.update(weather.weather)
 
       # Remove data from the queue without saving them
-      snapshot, rgb_image, semantic_image, gnss_data, location = ego_vehicle.get_sync_data(frame)
-
-    # We then loop until we reach the end of the simulation
-    for _ in tqdm(range(ticks_to_record), "Recording ticks"):
-      frame = world.tick()
+      for ego_vehicle in EgoVehicle.instances:
+        if args.capture_mode == "recorded":
+          ego_vehicle.get_captured_data(frame, (seq_timestamp+elapsed_time, get_weather_record()))
+        else:
+          ego_vehicle.get_sync_data(frame)
+
+    # If the cameras only capture the recorded frames, we loop until they have captured enough frames,
+    # saving each frame as soon as the images of both cameras have been received
+    if args.capture_mode == "recorded":
+      # We check that the sequences do not go over the 5h timeframe
+      nb_frames_to_record = min(args.nb_frames, 18000-seq_timestamp)
+      progress = tqdm(total=nb_frames_to_record*len(recorders), desc="Recording frames")
+      ticks_per_frame = int(hz/args.fps)
+      for _ in range(ticks_to_record + 2*ticks_per_frame):
+        if all(recorder.nb_frames_saved >= nb_frames_to_record for recorder in recorders):
+          break
+        loop_start = perf_counter()
+        with timer.measure("world_tick"):
+          frame = world.tick()
+        elapsed_time += 1.0/hz
 
-      if dynamic_weather == 'True' or dynamic_weather == 'true': # We update the weather 
+        if dynamic_weather == 'True' or dynamic_weather == 'true': # We update the weather 
+          with timer.measure("weather_update"):
+            weather.tick(seq_timestamp+elapsed_time)
+            world_state.update(weather.weather)
+
+        # The timestamp and the weather of the tick are saved with the images captured at this tick
+        tick_data = (seq_timestamp+elapsed_time, get_weather_record())
+        for recorder in recorders:
+          for snapshot, rgb_image, semantic_image, gnss_data, ego_state, (timestamp, captured_weather_record) in recorder.ego_vehicle.get_captured_data(frame, tick_data):
+            if recorder.nb_frames_saved >= nb_frames_to_record:
+              break
+            recorder.save(recorder.nb_frames_saved+1, rgb_image, semantic_image, gnss_data, ego_state, captured_weather_record, timestamp)
+            progress.update()
+        timer.add("loop", perf_counter() - loop_start)
+      progress.close()
+
+      # The images of some captures may not have been received (or paired with their tick) in time
+      for recorder in recorders:
+        if recorder.nb_frames_saved < nb_frames_to_record:
+          message = f"{recorder.folder_name}: only {recorder.nb_frames_saved}/{nb_frames_to_record} frames were captured"
+          if args.missing_frame_policy == "abort":
+            raise Exception(message + "!")
+          print(f"Warning: {message}.")
+
+    # Otherwise, we loop until we reach the end of the simulation
+    else:
+      for _ in tqdm(range(ticks_to_record), "Recording ticks"):
+        loop_start = perf_counter()
+        with timer.measure("world_tick"):
+          frame = world.tick()
         elapsed_time += 1.0/hz
-        weather.tick(seq_timestamp+elapsed_time)
-        world.set_weather(weather.weather)
-        # We turn off or on the lights depending on the sun altitude angle
-        if weather.weather.sun_altitude_angle < 1 :
-          light_manager.set_active(light_manager.get_all_lights(), [True for i in range(len(light_manager.get_all_lights()))])
-        else :
-          light_manager.set_active(light_manager.get_all_lights(), [False for i in range(len(light_manager.get_all_lights()))])
-
-      # Save data at args.fps frequency 
-      save_frame = False
-      if counter_frame%(hz/args.fps) == 0:
-        nb_frames_saved +=1
-        save_frame = True
-        counter_frame = 0
-
-      # We check that the sequence does not go over the 5h timeframe
-      if seq_timestamp+nb_frames_saved > 18000:
-          break
 
-      # Save 1000 files per folder
-      if nb_frames_saved%1000 == 0 and counter_frame%(hz/args.fps) == 0:
-        dir_name += 1
-
-      counter_frame += 1
-
-      # Get data from the queue
-      snapshot, rgb_image, semantic_image, gnss_data, location = ego_vehicle.get_sync_data(frame)
-
-      # Save data
-      if save_frame:
-        rgb_image.save_to_disk("{}/{}/images/{:03d}/{:06d}.png".format(args.output_folder, folder_name, dir_name, nb_frames_saved))
-        semantic_image.convert(carla.ColorConverter.CityScapesPalette)
-        semantic_image.save_to_disk("{}/{}/semantic_masks/{:03d}/{:06d}.png".format(args.output_folder, folder_name, dir_name, nb_frames_saved))
-        gnss_dic[nb_frames_saved] = {"latitude":gnss_data.latitude, "longitude":gnss_data.longitude, "altitude":gnss_data.altitude, "x":location.x, "y":location.y, "z":location.z}  
-        # Save GNSS data in a json file
-        with open('{}/{}/gnss.json'.format(args.output_folder, folder_name), 'w') as fp:
-          json.dump(gnss_dic, fp, sort_keys=True, indent=4)
-        if dynamic_weather == 'True' or dynamic_weather == 'true':
-          weather_dic[nb_frames_saved] = {"sun_azimuth_angle":weather.weather.sun_azimuth_angle, "sun_altitude_angle":weather.weather.sun_altitude_angle, "cloudiness":weather.weather.cloudiness, "precipitation":weather.weather.precipitation, 
-                                          "precipitation_deposits":weather.weather.precipitation_deposits, "wind_intensity":weather.weather.wind_intensity, "fog_density":weather.weather.fog_density, "fog_distance":weather.weather.fog_distance, 
-                                          "fog_falloff":weather.weather.fog_falloff, "wetness":weather.weather.wetness, "scattering_intensity":weather.weather.scattering_intensity, "mie_scattering_scale":weather.weather.mie_scattering_scale, 
-                                          "rayleigh_scattering_scale":weather.weather.rayleigh_scattering_scale}  
-          # Save weather data in a json file
-          with open('{}/{}/weather.json'.format(args.output_folder, folder_name), 'w') as fp:
-            json.dump(weather_dic, fp, sort_keys=True, indent=4)
+        if dynamic_weather == 'True' or dynamic_weather == 'true': # We update the weather 
+          with timer.measure("weather_update"):
+            weather.tick(seq_timestamp+elapsed_time)
+            world_state.update(weather.weather)
+
+        # Save data at args.fps frequency 
+        save_frame = False
+        if counter_frame%(hz/args.fps) == 0:
+          nb_frames_saved +=1
+          save_frame = True
+          counter_frame = 0
+
+        # We check that the sequence does not go over the 5h timeframe
+        if seq_timestamp+nb_frames_saved > 18000:
+            break
+
+        counter_frame += 1
+
+        weather_record = get_weather_record() if save_frame else None
+        for recorder in recorders:
+          # Get data from the queue (the frame is skipped if the data of a sensor were not received in time)
+          data = recorder.ego_vehicle.get_sync_data(frame)
+          if data is None:
+            if save_frame:
+              recorder.skip(nb_frames_saved)
+            continue
+          snapshot, rgb_image, semantic_image, gnss_data, ego_state = data
+
+          # Save data (the frames are numbered contiguously, even if some of them were skipped: the skipped
+          # frames are listed in the sequence json file, and the timestamp of each frame is in ego_state.json)
+          if save_frame:
+            recorder.save(recorder.nb_frames_saved+1, rgb_image, semantic_image, gnss_data, ego_state, weather_record, seq_timestamp+elapsed_time)
+        timer.add("loop", perf_counter() - loop_start)
+    completed = True
 
   # At the end (or if anything goes wrong), we remove all the vehicles/pedestrians from the
   # simulation
   finally:
-    ego_vehicle.destroy()
-    for vehicle in AIVehicle.instances:
-      vehicle.destroy()
-    for pedestrian in AIPedestrian.instances:
-      pedestrian.destroy()
+    # We wait for the pending images to be saved
+    frame_writer.close()
+    print("Frame writer: {}".format(frame_writer.stats()))
+
+    # We write the GNSS and weather data in their json files, and the durations of the phases of the recording
+    for recorder in recorders:
+      recorder.close(completed)
+      recorder.write_timing(timer)
+      if completed:
+        recorder.write_csv_row()
+    if dynamic_weather == 'True' or dynamic_weather == 'true':
+      print("Weather and lights updates: {}".format(world_state.stats()))
+
+    for ego_vehicle in list(EgoVehicle.instances):
+      if ego_vehicle.sync is not None:
+        print("Sensor synchronizer: {}".format(ego_vehicle.sync.stats()))
+      ego_vehicle.destroy()
+    population.destroy()
+
+  return [recorder.folder_name for recorder in recorders]
+
+
+
+def main():
+  """Main function"""
+
+  # We begin by collecting the command-line args
+  args = parse_args()
+
+  # We connect to the CARLA simulator
+  client = carla.Client(args.host, args.port)
+  client.set_timeout(300.0)
+
+  # We load the map and generate the sequence
+  world, traffic_manager = setup_world(client, args)
+  generate_sequence(client, world, traffic_manager, args)
 
   # And for some reason, we have to wait for a few seconds to avoid having the process crashing with
   # a "terminate called without an active exception" error
@@ -10,8 +10,8 @@ import argparse
 from time import time
 
 
-def parse_args():
-  """Arguments parsing function"""
+def get_argparser():
+  """Creates the arguments parser, which can be extended by other scripts"""
   argparser = argparse.ArgumentParser()
   argparser.add_argument(
     "--host",
@@ -43,6 +43,26 @@ def parse_args():
     default=1,
     type=int,
     help="Number of frames acquired per second (default: 1)")
+  argparser.add_argument(
+    "--capture-mode",
+    default="every_tick",
+    choices=["every_tick", "recorded"],
+    help="Whether the cameras capture images on every tick, or only at the recording frequency (default: every_tick)")
+  argparser.add_argument(
+    "--sensor-timeout",
+    default=10.0,
+    type=float,
+    help="Maximum time (in seconds) to wait for the world snapshot and the GNSS data of a tick (default: 10.0)")
+  argparser.add_argument(
+    "--camera-timeout",
+    default=30.0,
+    type=float,
+    help="Maximum time (in seconds) to wait for the images of the cameras (default: 30.0)")
+  argparser.add_argument(
+    "--missing-frame-policy",
+    default="skip",
+    choices=["skip", "abort"],
+    help="Whether a frame whose sensor data are not received in time is skipped or stops the generation (default: skip)")
   argparser.add_argument(
     "--nb_frames",
     type=int,
@@ -58,6 +78,11 @@ def parse_args():
     default="90",
     type=str,
     help="FOV of the RGB camera and other equivalent sensors (default: 90°)")
+  argparser.add_argument(
+    "--nb_egos",
+    default=1,
+    type=int,
+    help="Number of ego-vehicles, each recording its own sequence in the same simulation (default: 1)")
   argparser.add_argument(
     "--nvehicles",
     default=50,
@@ -68,6 +93,11 @@ def parse_args():
     default=50,
     type=int,
     help="Number of pedestrians in the environment (default: 50)")
+  argparser.add_argument(
+    "--spawn-attempts",
+    default=5,
+    type=int,
+    help="Number of batches sent to spawn the missing vehicles and pedestrians (default: 5)")
   argparser.add_argument(
     "--dynamic_weather",
     default="False",
@@ -83,6 +113,16 @@ def parse_args():
     default=0,
     type=int,
     help="Cloudiness (default: 0 (clear sky))")
+  argparser.add_argument(
+    "--light-refresh-ticks",
+    default=100,
+    type=int,
+    help="Number of ticks after which the list of street lights is fetched again (default: 100)")
+  argparser.add_argument(
+    "--sun-tolerance",
+    default=0.1,
+    type=float,
+    help="Change of the sun angles (in degrees) below which the weather is not sent again to the simulator. The sun of the simulator then lags by at most this angle, about 5 s of simulated time (default: 0.1)")
   argparser.add_argument(
     "-o", "--output_folder",
     default="dataset",
@@ -93,6 +133,21 @@ def parse_args():
     default="dataset/metadata.csv",
     type=str,
     help="Path of the created/updated csv metadata file (default: dataset/metadata.csv)")
+  argparser.add_argument(
+    "--writer-workers",
+    default=2,
+    type=int,
+    help="Number of threads encoding and saving the images to disk (default: 2)")
+  argparser.add_argument(
+    "--writer-queue-size",
+    default=8,
+    type=int,
+    help="Maximum number of images waiting to be saved before the simulation is paused (default: 8)")
+  argparser.add_argument(
+    "--metadata-flush-every",
+    default=100,
+    type=int,
+    help="Number of frames kept in memory before their GNSS/weather data are appended to disk (default: 100)")
   argparser.add_argument(
     "--discard-duration",
     default=3.0,
@@ -103,4 +158,9 @@ def parse_args():
     default=int(time()),
     type=int,
     help="Random seed for reproducibility (default: time.time())")
-  return argparser.parse_args()
+  return argparser
+
+
+def parse_args():
+  """Arguments parsing function"""
+  return get_argparser().parse_args()
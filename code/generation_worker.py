@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+This script can be used to generate several sequences in the CARLA simulator, loading the map only once.
+Between two sequences, all the actors are removed, the simulation settings and the traffic manager are
+configured again, and a new folder is created. Sequence i is generated with the seed (--seed + i), so
+that it can be generated again with generate_sequence.py.
+
+It accepts the same arguments as generate_sequence.py, plus the number of sequences to generate.
+"""
+
+from time import sleep
+
+import carla
+
+from generate_sequence import configure_simulation, generate_sequence, setup_world
+from generate_sequence_args import get_argparser
+
+
+def main():
+  """Main function"""
+
+  # We begin by collecting the command-line args
+  argparser = get_argparser()
+  argparser.add_argument(
+    "--nb_seq",
+    default=1,
+    type=int,
+    help="Number of sequences to generate (default: 1)")
+  args = argparser.parse_args()
+  base_seed = args.seed
+
+  # We connect to the CARLA simulator
+  client = carla.Client(args.host, args.port)
+  client.set_timeout(300.0)
+
+  # We load the map once for all the sequences
+  world, traffic_manager = setup_world(client, args)
+
+  for i in range(args.nb_seq):
+    print(f"Generating sequence {i+1}/{args.nb_seq}...")
+    args.seed = base_seed + i
+    if i > 0:
+      # We restore the simulation settings (changed during the recording) and seed the traffic manager
+      traffic_manager = configure_simulation(client, world, args)
+    folder_names = generate_sequence(client, world, traffic_manager, args)
+    print(f"Sequence(s) {', '.join(folder_names)} generated with seed {args.seed}.")
+
+    # We tick once, so that the actors of the sequence are removed from the simulation
+    world.tick()
+
+  # And for some reason, we have to wait for a few seconds to avoid having the process crashing with
+  # a "terminate called without an active exception" error
+  sleep(5)
+
+
+if __name__ == "__main__":
+  main()
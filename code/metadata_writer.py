@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MetadataWriter class definition.
+
+The per-frame metadata of a sequence (gnss.json, ego_state.json, weather.json) is appended to a
+JSON-lines log while the sequence is being recorded, so that the cost of saving a frame does not
+depend on the length of the sequence. The log is converted to the final json file when the sequence is closed.
+
+If the generation process was killed before the log could be converted, the json files can be
+rebuilt from the remaining logs with:
+    python3 metadata_writer.py path/to/sequence
+"""
+
+import argparse
+import glob
+import json
+import os
+
+
+class MetadataWriter:
+  """An append-only writer for a dictionary of per-frame records, saved as a json file"""
+
+  def __init__(self, path, flush_every=100):
+    """
+    Opens the log associated to the json file at the given path.
+    Records are kept in memory and appended to the log every flush_every frames.
+    """
+    self.path = path
+    self.log_path = log_path(path)
+    self.flush_every = max(1, flush_every)
+    self._buffer = []
+    self._log = open(self.log_path, 'a')
+
+
+  def write(self, frame, record):
+    """Adds the record of the given frame"""
+    self._buffer.append(json.dumps([frame, record]) + "\n")
+    if len(self._buffer) >= self.flush_every:
+      self.flush()
+
+
+  def flush(self):
+    """Appends the buffered records to the log and makes sure they reach the disk"""
+    if not self._buffer:
+      return
+    self._log.write("".join(self._buffer))
+    self._log.flush()
+    os.fsync(self._log.fileno())
+    self._buffer = []
+
+
+  def close(self):
+    """Flushes the remaining records and converts the log to the final json file"""
+    if self._log.closed:
+      return
+    self.flush()
+    self._log.close()
+    finalize(self.path)
+
+
+
+def log_path(path):
+  """Gets the path of the log associated to a json file"""
+  return os.path.splitext(path)[0] + ".jsonl"
+
+
+
+def read_log(path):
+  """Reads the records of a log. A truncated last line (process killed while writing) is ignored."""
+  records = {}
+  with open(path) as fp:
+    for line in fp:
+      try:
+        frame, record = json.loads(line)
+      except ValueError:
+        break
+      records[frame] = record
+  return records
+
+
+
+def finalize(path):
+  """Converts the log of a json file to the json file itself, and removes the log"""
+  records = read_log(log_path(path))
+  if records:
+    # The file is first written next to its final location, so that an existing json file is never
+    # left half-written
+    with open(path + ".tmp", 'w') as fp:
+      json.dump(records, fp, sort_keys=True, indent=4)
+    os.replace(path + ".tmp", path)
+  os.remove(log_path(path))
+
+
+
+def main():
+  """Rebuilds the json files of the given sequences from their remaining logs"""
+  argparser = argparse.ArgumentParser(description="Rebuilds gnss.json/ego_state.json/weather.json from their logs.")
+  argparser.add_argument("sequences", nargs="+", help="Path to the sequence folders")
+  args = argparser.parse_args()
+
+  for sequence in args.sequences:
+    for path in sorted(glob.glob(os.path.join(sequence, "*.jsonl"))):
+      print(f"Rebuilding {os.path.splitext(path)[0]}.json")
+      finalize(os.path.splitext(path)[0] + ".json")
+
+
+if __name__ == "__main__":
+  main()
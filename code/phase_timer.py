@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PhaseTimer class definition.
+
+The durations of the phases of the recording loop (world tick, sensor waits, weather updates, image
+encoding, metadata writes...) are gathered in histograms with logarithmic buckets: recording a
+duration only increments a counter, so that the timers can be left on during the generation. The
+percentiles are estimated from the buckets, with a relative error of about 6%.
+"""
+
+import math
+import threading
+import time
+
+# Buckets of the histograms: 20 per decade, from 1 µs to 1000 s
+BUCKETS_PER_DECADE = 20
+MIN_DURATION = 1e-6
+NB_BUCKETS = 9*BUCKETS_PER_DECADE + 2
+
+
+class PhaseHistogram:
+  """The histogram of the durations of a phase"""
+
+  def __init__(self):
+    self.counts = [0]*NB_BUCKETS
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+
+  def add(self, duration):
+    """Adds a duration, in seconds"""
+    if duration < MIN_DURATION:
+      bucket = 0
+    else:
+      bucket = min(NB_BUCKETS - 1, int(math.log10(duration/MIN_DURATION)*BUCKETS_PER_DECADE) + 1)
+    self.counts[bucket] += 1
+    self.count += 1
+    self.total += duration
+    if duration > self.max:
+      self.max = duration
+
+
+  def percentile(self, percent):
+    """Estimates a percentile of the durations, in seconds (the middle of its bucket)"""
+    if self.count == 0:
+      return 0.0
+    rank = max(1, math.ceil(self.count*percent/100))
+    seen = 0
+    for bucket, count in enumerate(self.counts):
+      seen += count
+      if seen >= rank:
+        break
+    if bucket == 0:
+      return min(MIN_DURATION, self.max)
+    return min(MIN_DURATION*10**((bucket - 0.5)/BUCKETS_PER_DECADE), self.max)
+
+
+  def report(self):
+    """Gets the statistics of the phase (durations in milliseconds)"""
+    return {"count":self.count, "total_s":round(self.total, 6), "mean_ms":round(1000*self.total/max(1, self.count), 4),
+            "p50_ms":round(1000*self.percentile(50), 4), "p95_ms":round(1000*self.percentile(95), 4), "max_ms":round(1000*self.max, 4)}
+
+
+
+class PhaseTimer:
+  """The histograms of the durations of named phases, which can be timed from several threads"""
+
+  def __init__(self):
+    self.phases = {}
+    self._lock = threading.Lock()
+
+
+  def measure(self, name):
+    """Gets a context manager which adds the duration of its block to the given phase"""
+    return _Measure(self, name)
+
+
+  def add(self, name, duration):
+    """Adds a duration (in seconds) to the given phase"""
+    with self._lock:
+      histogram = self.phases.get(name)
+      if histogram is None:
+        histogram = self.phases[name] = PhaseHistogram()
+      histogram.add(duration)
+
+
+  def report(self):
+    """Gets the statistics of each phase, by name"""
+    with self._lock:
+      return {name:histogram.report() for name, histogram in self.phases.items()}
+
+
+
+class _Measure:
+  """Context manager timing a block of code"""
+
+  __slots__ = ("timer", "name", "start")
+
+  def __init__(self, timer, name):
+    self.timer = timer
+    self.name = name
+
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+
+  def __exit__(self, *exc_info):
+    self.timer.add(self.name, time.perf_counter() - self.start)
+    return False
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Population class definition.
+
+The AI-controlled vehicles and pedestrians are spawned (and destroyed) with batches of commands,
+instead of one call to the simulator per actor and per attempt.
+"""
+
+import random
+
+import carla
+
+from ai_pedestrian import AIPedestrian
+from ai_vehicle import AIVehicle
+
+
+class Population:
+  """Spawns and destroys the AI-controlled vehicles and pedestrians of the simulated world"""
+
+  def __init__(self, client, world, traffic_manager, args):
+    """Fetches the blueprints once for all"""
+    self.client = client
+    self.world = world
+    self.traffic_manager = traffic_manager
+    self.max_attempts = args.spawn_attempts
+
+    library = world.get_blueprint_library()
+    self.vehicle_blueprints = list(library.filter("vehicle"))
+    self.pedestrian_blueprints = list(library.filter("walker.pedestrian.*"))
+    self.controller_blueprint = library.find("controller.ai.walker")
+
+
+
+  def spawn_vehicles(self, nb_vehicles, spawn_points):
+    """
+    Spawns nb_vehicles vehicles with their autopilot enabled. The spawn points are drawn without
+    replacement, and the ones that fail (collision) are replaced during the next attempts.
+    """
+    spawn_points = random.sample(spawn_points, len(spawn_points))
+    SpawnActor = carla.command.SpawnActor
+    SetAutopilot = carla.command.SetAutopilot
+    FutureActor = carla.command.FutureActor
+
+    for _ in range(self.max_attempts):
+      nb_missing = nb_vehicles - len(AIVehicle.instances)
+      if nb_missing <= 0 or not spawn_points:
+        break
+      transforms, spawn_points = spawn_points[:nb_missing], spawn_points[nb_missing:]
+      batch = [SpawnActor(random.choice(self.vehicle_blueprints), transform)
+               .then(SetAutopilot(FutureActor, True, self.traffic_manager.get_port()))
+               for transform in transforms]
+      actor_ids = [response.actor_id for response in self.client.apply_batch_sync(batch, False) if not response.error]
+      for vehicle in self.world.get_actors(actor_ids):
+        AIVehicle.from_actor(vehicle, self.world, self.traffic_manager)
+
+    if len(AIVehicle.instances) < nb_vehicles:
+      print(f"Only {len(AIVehicle.instances)}/{nb_vehicles} vehicles could be spawned.")
+
+
+
+  def spawn_pedestrians(self, nb_pedestrians):
+    """Spawns nb_pedestrians pedestrians at random locations, with their controllers"""
+    SpawnActor = carla.command.SpawnActor
+
+    for _ in range(self.max_attempts):
+      nb_missing = nb_pedestrians - len(AIPedestrian.instances)
+      if nb_missing <= 0:
+        break
+
+      # We spawn the pedestrians
+      locations = [self.world.get_random_location_from_navigation() for _ in range(nb_missing)]
+      batch = [SpawnActor(random.choice(self.pedestrian_blueprints), carla.Transform(location=location))
+               for location in locations if location is not None]
+      pedestrian_ids = [response.actor_id for response in self.client.apply_batch_sync(batch, False) if not response.error]
+
+      # We must add a controller to each pedestrian for it to walk in the world
+      batch = [SpawnActor(self.controller_blueprint, carla.Transform(), pedestrian_id) for pedestrian_id in pedestrian_ids]
+      responses = self.client.apply_batch_sync(batch, False)
+      pairs = [(pedestrian_id, response.actor_id) for pedestrian_id, response in zip(pedestrian_ids, responses) if not response.error]
+      orphans = [pedestrian_id for pedestrian_id, response in zip(pedestrian_ids, responses) if response.error]
+      if orphans:
+        self.client.apply_batch([carla.command.DestroyActor(pedestrian_id) for pedestrian_id in orphans])
+
+      actors = {actor.id: actor for actor in self.world.get_actors([actor_id for pair in pairs for actor_id in pair])}
+      for pedestrian_id, controller_id in pairs:
+        AIPedestrian.from_actors(actors[pedestrian_id], actors[controller_id], self.world)
+
+    if len(AIPedestrian.instances) < nb_pedestrians:
+      print(f"Only {len(AIPedestrian.instances)}/{nb_pedestrians} pedestrians could be spawned.")
+
+
+
+  def destroy(self):
+    """Destroys all the vehicles and pedestrians (with their controllers) in a single batch"""
+    for pedestrian in AIPedestrian.instances:
+      pedestrian.controller.stop()
+    actors = [pedestrian.controller for pedestrian in AIPedestrian.instances]
+    actors += [pedestrian.pedestrian for pedestrian in AIPedestrian.instances]
+    actors += [vehicle.vehicle for vehicle in AIVehicle.instances]
+    self.client.apply_batch_sync([carla.command.DestroyActor(actor) for actor in actors], False)
+    AIPedestrian.instances.clear()
+    AIVehicle.instances.clear()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Semantic segmentation labels used by CARLA (version 0.9.14), and reduced labels of the DADE dataset.
+See https://carla.readthedocs.io/en/0.9.14/ref_sensors/#semantic-segmentation-camera
+"""
+
+import numpy as np
+
+
+# Tag, name and CityScapesPalette color of the classes of the semantic segmentation camera
+CARLA_CLASSES = [
+  (0, "unlabeled", (0, 0, 0)),
+  (1, "road", (128, 64, 128)),
+  (2, "sidewalk", (244, 35, 232)),
+  (3, "building", (70, 70, 70)),
+  (4, "wall", (102, 102, 156)),
+  (5, "fence", (190, 153, 153)),
+  (6, "pole", (153, 153, 153)),
+  (7, "traffic light", (250, 170, 30)),
+  (8, "traffic sign", (220, 220, 0)),
+  (9, "vegetation", (107, 142, 35)),
+  (10, "terrain", (152, 251, 152)),
+  (11, "sky", (70, 130, 180)),
+  (12, "pedestrian", (220, 20, 60)),
+  (13, "rider", (255, 0, 0)),
+  (14, "car", (0, 0, 142)),
+  (15, "truck", (0, 0, 70)),
+  (16, "bus", (0, 60, 100)),
+  (17, "train", (0, 80, 100)),
+  (18, "motorcycle", (0, 0, 230)),
+  (19, "bicycle", (119, 11, 32)),
+  (20, "static", (110, 190, 160)),
+  (21, "dynamic", (170, 120, 50)),
+  (22, "other", (55, 90, 80)),
+  (23, "water", (45, 60, 150)),
+  (24, "road line", (157, 234, 50)),
+  (25, "ground", (81, 0, 81)),
+  (26, "bridge", (150, 100, 100)),
+  (27, "rail track", (230, 150, 140)),
+  (28, "guard rail", (180, 165, 180)),
+]
+
+# Lookup table giving the CityScapesPalette color of each tag (unknown tags are black)
+CARLA_PALETTE = np.zeros((256, 3), dtype=np.uint8)
+for tag, _, color in CARLA_CLASSES:
+  CARLA_PALETTE[tag] = color
+
+
+# ID, name and color of the reduced classes of the DADE semantic_masks and semantic_masks_npz, which
+# are common with the Cityscapes dataset
+DADE_CLASSES = [
+  (0, "unlabeled", (0, 0, 0)),
+  (1, "static", (0, 0, 0)),
+  (2, "dynamic", (111, 74, 0)),
+  (3, "ground", (81, 0, 81)),
+  (4, "road", (128, 64, 128)),
+  (5, "sidewalk", (244, 35, 232)),
+  (6, "rail track", (230, 150, 140)),
+  (7, "building", (70, 70, 70)),
+  (8, "wall", (102, 102, 156)),
+  (9, "fence", (190, 153, 153)),
+  (10, "guard rail", (180, 165, 180)),
+  (11, "bridge", (150, 100, 100)),
+  (12, "pole", (153, 153, 153)),
+  (13, "traffic light", (250, 170, 30)),
+  (14, "traffic sign", (220, 220, 0)),
+  (15, "vegetation", (107, 142, 35)),
+  (16, "terrain", (152, 251, 152)),
+  (17, "sky", (70, 130, 180)),
+  (18, "person", (220, 20, 60)),
+  (19, "rider", (255, 0, 0)),
+  (20, "car", (0, 0, 142)),
+  (21, "truck", (0, 0, 70)),
+  (22, "bus", (0, 60, 100)),
+  (23, "motorcycle", (0, 0, 230)),
+  (24, "bicycle", (119, 11, 32)),
+]
+
+# Lookup table giving the color of each DADE ID (unknown IDs are black)
+DADE_PALETTE = np.zeros((256, 3), dtype=np.uint8)
+for label_id, _, color in DADE_CLASSES:
+  DADE_PALETTE[label_id] = color
+
+# DADE ID of each CARLA tag. The road lines are part of the road, and the terrain, train, other and
+# water classes are left unlabeled (as in the released masks).
+CARLA_TO_DADE = {
+  0: 0, 1: 4, 2: 5, 3: 7, 4: 8, 5: 9, 6: 12, 7: 13, 8: 14, 9: 15, 10: 0, 11: 17, 12: 18, 13: 19, 14: 20,
+  15: 21, 16: 22, 17: 0, 18: 23, 19: 24, 20: 1, 21: 2, 22: 0, 23: 0, 24: 4, 25: 3, 26: 11, 27: 6, 28: 10,
+}
+
+# Lookup table giving the DADE ID of each CARLA tag (unknown tags are unlabeled)
+CARLA_TO_DADE_LUT = np.zeros(256, dtype=np.uint8)
+for tag, label_id in CARLA_TO_DADE.items():
+  CARLA_TO_DADE_LUT[tag] = label_id
+
+# CARLA tag of the hood of the ego-vehicle
+HOOD_TAG = 14
+
+
+def get_hood_mask(tags):
+  """
+  Gets the mask of the hood of the ego-vehicle in an array of CARLA tags: in each column, the pixels of
+  the car class going up without interruption from the bottom of the image.
+  """
+  return np.logical_and.accumulate(tags[::-1] == HOOD_TAG, axis=0)[::-1]
+
+
+
+def carla_to_dade(tags, lut=CARLA_TO_DADE_LUT):
+  """Converts an array of CARLA tags to DADE IDs with the given lookup table, the hood of the ego-vehicle being unlabeled"""
+  ids = lut[tags]
+  ids[get_hood_mask(tags)] = 0
+  return ids
+
+
+
+def get_color_keys(rgb):
+  """Packs the colors of an (..., 3) array of uint8 into 24-bit integers"""
+  rgb = rgb.astype(np.int32)
+  return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+
+def get_color_to_tag_lut():
+  """Gets a lookup table giving the CARLA tag of each 24-bit color of the CityScapesPalette (other colors are unlabeled)"""
+  lut = np.zeros(1 << 24, dtype=np.uint8)
+  for tag, _, color in CARLA_CLASSES:
+    lut[get_color_keys(np.array(color, dtype=np.uint8))] = tag
+  return lut
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SensorSynchronizer class definition.
+
+The messages of the world (snapshots) and of the sensors are received from the CARLA threads in bounded
+queues (the oldest message is dropped when a queue is full), and are matched by frame id in bounded
+buffers. A sensor which does not send the data of a frame within its timeout costs that frame, instead
+of blocking the generation forever.
+"""
+
+from collections import Counter
+from functools import partial
+import queue
+import time
+
+
+class SensorSynchronizer:
+  """Matches the messages of several sensors by frame id"""
+
+  def __init__(self, timeouts, max_buffered_frames=64, missing_frame_policy="skip"):
+    """
+    timeouts gives, for each sensor name, the maximum time (in seconds) to wait for its data.
+    Each sensor keeps at most max_buffered_frames messages waiting to be received, and as many waiting
+    to be matched.
+    When the data of a sensor is missing, the frame is skipped (missing_frame_policy "skip"), or an
+    exception is raised (missing_frame_policy "abort").
+    """
+    if missing_frame_policy not in ["skip", "abort"]:
+      raise Exception(f"Unknown missing frame policy {missing_frame_policy}!")
+    self.timeouts = timeouts
+    self.max_buffered_frames = max_buffered_frames
+    self.missing_frame_policy = missing_frame_policy
+
+    self._queues = {name: queue.Queue(maxsize=max_buffered_frames) for name in timeouts}
+    self._buffers = {name: {} for name in timeouts}
+    self._next_frames = {name: 0 for name in timeouts} # Messages of older frames are late
+
+    # Counters of the messages, for each sensor
+    self.nb_received = Counter()
+    self.nb_late = Counter() # Messages received after their frame was skipped or discarded
+    self.nb_dropped = Counter() # Messages removed from a full queue or buffer, or never matched
+    self.nb_timeouts = Counter() # Frames skipped because the message of the sensor was missing
+
+
+
+  def callback(self, name):
+    """Gets the function to register to receive the messages of a sensor (world.on_tick, sensor.listen)"""
+    return partial(self._put, name)
+
+
+
+  def get(self, frame, names):
+    """
+    Waits for the messages of the given sensors for the given frame, and returns them in a list.
+    Returns None if one of them is missing (unless the policy is "abort").
+    """
+    messages = []
+    for name in names:
+      message = self._wait(name, frame)
+      if message is None:
+        self.nb_timeouts[name] += 1
+        if self.missing_frame_policy == "abort":
+          raise Exception(f"No data received from the {name} sensor for frame {frame}!")
+        self.discard_before(frame+1, names)
+        return None
+      messages.append(message)
+    self.discard_before(frame+1, names)
+    return messages
+
+
+
+  def poll(self):
+    """Stores the messages received so far, without waiting"""
+    for name in self._queues:
+      while True:
+        try:
+          message = self._queues[name].get_nowait()
+        except queue.Empty:
+          break
+        self._store(name, message)
+
+
+
+  def take(self, frame, names):
+    """Returns the messages of the given sensors for the given frame if they have all been received, None otherwise"""
+    if not all(frame in self._buffers[name] for name in names):
+      return None
+    return [self._buffers[name].pop(frame) for name in names]
+
+
+
+  def discard_before(self, frame, names=None):
+    """Forgets the messages of the frames older than the given frame, which can no longer be matched"""
+    for name in names if names is not None else self._buffers:
+      self._next_frames[name] = max(self._next_frames[name], frame)
+      buffer = self._buffers[name]
+      for old_frame in [f for f in buffer if f < frame]:
+        del buffer[old_frame]
+        self.nb_dropped[name] += 1
+
+
+
+  def stats(self):
+    """Gets the counters of the messages, for each sensor"""
+    return {name: {"received":self.nb_received[name], "late":self.nb_late[name], "dropped":self.nb_dropped[name],
+                   "timeouts":self.nb_timeouts[name], "buffered":len(self._buffers[name])} for name in self._buffers}
+
+
+
+  def _put(self, name, message):
+    # Called from the CARLA threads: if the generation does not keep up, the oldest message is dropped
+    # instead of letting the queue grow
+    sensor_queue = self._queues[name]
+    while True:
+      try:
+        sensor_queue.put_nowait(message)
+        return
+      except queue.Full:
+        try:
+          sensor_queue.get_nowait()
+          self.nb_dropped[name] += 1
+        except queue.Empty:
+          pass
+
+
+
+  def _wait(self, name, frame):
+    buffer = self._buffers[name]
+    deadline = time.monotonic() + self.timeouts[name]
+    while frame not in buffer:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return None
+      try:
+        message = self._queues[name].get(timeout=remaining)
+      except queue.Empty:
+        return None
+      self._store(name, message)
+    return buffer.pop(frame)
+
+
+
+  def _store(self, name, message):
+    self.nb_received[name] += 1
+    if message.frame < self._next_frames[name]:
+      self.nb_late[name] += 1
+      return
+    buffer = self._buffers[name]
+    buffer[message.frame] = message
+    if len(buffer) > self.max_buffered_frames:
+      del buffer[min(buffer)]
+      self.nb_dropped[name] += 1
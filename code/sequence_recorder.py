@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+SequenceRecorder class definition.
+
+Each ego-vehicle of the simulation records its own sequence, in its own folder.
+"""
+
+import csv
+from datetime import datetime
+import fcntl
+import json
+import os
+
+from metadata_writer import MetadataWriter
+
+
+class SequenceRecorder:
+  """The sequence recorded by an ego-vehicle: its folder, its metadata, and the frames saved so far"""
+
+  def __init__(self, ego_vehicle, frame_writer, seq_timestamp, args):
+    """Creates the folder of the sequence and saves its metadata"""
+    self.ego_vehicle = ego_vehicle
+    self.frame_writer = frame_writer
+    self.output_folder = args.output_folder
+    self.nb_frames_saved = 0
+    self.skipped_frames = [] # Frames lost because the data of a sensor were not received in time
+    self.folder_name = create_sequence_folder(args.output_folder)
+
+    # The metadata of the csv file are only saved once the sequence is complete (see write_csv_row)
+    self.csv_file = args.csv_file
+    self.csv_row = [self.folder_name, args.map, args.seed, args.dynamic_weather, args.sun_altitude, args.cloudiness, args.nvehicles, args.npedestrians, seq_timestamp]
+
+    # Save metadata of the sequence in json file (completed when the sequence is closed)
+    self.metadata = {"timestamp":seq_timestamp, "map":args.map, "seed":args.seed, "dynamic_weather":args.dynamic_weather, "nb_vehicles":args.nvehicles, "nb_pedestrians":args.npedestrians, "seq_length":"NaN",
+                     "capture_mode":args.capture_mode, "nb_frames_requested":args.nb_frames}
+    self.write_metadata()
+
+    # We open the writers of the per-frame metadata
+    self.gnss_writer = MetadataWriter('{}/{}/gnss.json'.format(self.output_folder, self.folder_name), args.metadata_flush_every)
+    self.ego_state_writer = MetadataWriter('{}/{}/ego_state.json'.format(self.output_folder, self.folder_name), args.metadata_flush_every)
+    self.weather_writer = None
+    if args.dynamic_weather == 'True' or args.dynamic_weather == 'true':
+      self.weather_writer = MetadataWriter('{}/{}/weather.json'.format(self.output_folder, self.folder_name), args.metadata_flush_every)
+
+
+
+  def save(self, nb_frame, rgb_image, semantic_image, gnss_data, ego_state, weather_record, timestamp=None):
+    """Saves the data of a frame, captured at the given timestamp (in seconds, in the 5h time frame)"""
+    self.nb_frames_saved = nb_frame
+    timer = self.ego_vehicle.timer
+    # Save 1000 files per folder
+    dir_name = nb_frame//1000 + 1
+    with timer.measure("submit_rgb"):
+      self.frame_writer.save_rgb(rgb_image, "{}/{}/images/{:03d}/{:06d}.png".format(self.output_folder, self.folder_name, dir_name, nb_frame))
+    # The ground truths are saved with the CARLA labels, and with the reduced labels of DADE
+    with timer.measure("submit_semantic"):
+      self.frame_writer.save_semantic(semantic_image,
+                                      "{}/{}/semantic_masks_carla/{:03d}/{:06d}.png".format(self.output_folder, self.folder_name, dir_name, nb_frame),
+                                      "{}/{}/semantic_masks/{:03d}/{:06d}.png".format(self.output_folder, self.folder_name, dir_name, nb_frame),
+                                      "{}/{}/semantic_masks_npz/{:03d}/{:06d}.npz".format(self.output_folder, self.folder_name, dir_name, nb_frame))
+    # Append GNSS, ego-vehicle state and weather data to their logs (the x,y,z of the GNSS data are the location of the ego-vehicle)
+    with timer.measure("metadata_write"):
+      location = ego_state["location"]
+      self.gnss_writer.write(nb_frame, {"latitude":gnss_data.latitude, "longitude":gnss_data.longitude, "altitude":gnss_data.altitude, "x":location["x"], "y":location["y"], "z":location["z"]})
+      self.ego_state_writer.write(nb_frame, dict(ego_state, timestamp=timestamp))
+      if self.weather_writer is not None and weather_record is not None:
+        self.weather_writer.write(nb_frame, weather_record)
+
+
+
+  def skip(self, frame):
+    """
+    Records that a frame was lost. The frames are numbered contiguously, so that the given number is the
+    one the frame would have had if no frame had been lost.
+    """
+    self.skipped_frames.append(frame)
+    print(f"{self.folder_name}: frame {frame} skipped, the data of a sensor were not received in time")
+
+
+
+  def write_metadata(self):
+    """Writes the metadata of the sequence in its json file"""
+    with open('{}/{}/{}.json'.format(self.output_folder, self.folder_name, self.folder_name), 'w') as fp:
+      json.dump(self.metadata, fp, indent=4)
+
+
+
+  def close(self, completed=True):
+    """
+    Writes the GNSS, ego-vehicle state and weather data in their json files, and completes the metadata
+    of the sequence. If the recording did not complete, seq_length is left to "NaN" (see generate_dataset.py).
+    """
+    with self.ego_vehicle.timer.measure("metadata_close"):
+      self.gnss_writer.close()
+      self.ego_state_writer.close()
+      if self.weather_writer is not None:
+        self.weather_writer.close()
+      if completed:
+        self.metadata["seq_length"] = self.nb_frames_saved
+      self.metadata["skipped_frames"] = self.skipped_frames
+      self.write_metadata()
+
+
+
+  def write_csv_row(self):
+    """Saves the metadata of the complete sequence in the csv file (the file is locked, as it may be shared by parallel generations)"""
+    with open(self.csv_file, 'a', newline='') as csv_file:
+        fcntl.flock(csv_file, fcntl.LOCK_EX)
+        csv_writer = csv.writer(csv_file, delimiter=';')
+        csv_writer.writerow(self.csv_row)
+        csv_file.flush()
+        fcntl.flock(csv_file, fcntl.LOCK_UN)
+
+
+
+  def write_timing(self, simulation_timer):
+    """
+    Writes the durations of the phases of the recording in <sequence>_timing.json: the phases of the
+    simulation (world ticks, weather updates) and of the frame writer are shared by all the sequences
+    recorded in the same simulation, the other phases are the ones of this sequence.
+    """
+    report = {"nb_frames":self.nb_frames_saved, "simulation":simulation_timer.report(),
+              "sequence":self.ego_vehicle.timer.report(), "frame_writer":self.frame_writer.timer.report()}
+    with open('{}/{}/{}_timing.json'.format(self.output_folder, self.folder_name, self.folder_name), 'w') as fp:
+      json.dump(report, fp, indent=4)
+
+
+
+def create_sequence_folder(output_folder):
+  """
+  Creates the folder of a new sequence, named after the current date and time. Sequences started
+  during the same second (in parallel, or by several ego-vehicles) get a suffix.
+  """
+  folder_name = str(datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+  os.makedirs(output_folder, exist_ok=True)
+  base_folder_name = folder_name
+  suffix = 0
+  while True:
+    try:
+      os.mkdir('{}/{}'.format(output_folder, folder_name))
+      return folder_name
+    except FileExistsError:
+      suffix += 1
+      folder_name = "{}_{}".format(base_folder_name, suffix)
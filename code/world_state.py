@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WorldStateSync class definition.
+
+The weather and the street lights are only sent to the simulator when they change, instead of on
+every world tick. The calls made to the simulator are counted, so that their overhead can be measured.
+"""
+
+from collections import Counter
+
+from dynamic_weather import WEATHER_JSON_PARAMETERS
+
+
+class WorldStateSync:
+  """Keeps the weather and the street lights of the simulated world up to date"""
+
+  def __init__(self, world, light_refresh_ticks=100, sun_tolerance=0.1):
+    """
+    The list of lights is fetched again every light_refresh_ticks ticks, to catch the lights of the
+    tiles loaded in the meantime (large maps). Changes of the sun angles smaller than sun_tolerance
+    (in degrees) are not pushed, unless another weather parameter changes: the sun moves by at most
+    0.02 degree per simulated second, so that the default 0.1 degree (a fifth of the apparent diameter of
+    the sun) saves all the updates but one every 5 s. The angles saved in weather.json are the exact ones.
+    """
+    self.world = world
+    self.light_manager = world.get_lightmanager()
+    self.light_refresh_ticks = light_refresh_ticks
+    self.sun_tolerance = sun_tolerance
+
+    self._weather_values = None
+    self._lights = []
+    self._light_ids = set()
+    self._lights_on = None
+    self._ticks_since_refresh = None
+
+    # Counters of the calls to the simulator
+    self.nb_ticks = 0
+    self.rpcs = Counter()
+    self.rpcs_per_tick = Counter() # Number of ticks for each number of calls made during a tick
+
+
+
+  def update(self, weather):
+    """
+    Pushes the given carla.WeatherParameters if they changed, and turns the lights on or off depending
+    on the sun altitude angle. Must be called once per world tick.
+    """
+    nb_rpcs = sum(self.rpcs.values())
+    self.nb_ticks += 1
+
+    values = tuple(getattr(weather, name) for name in WEATHER_JSON_PARAMETERS)
+    if self._weather_changed(values):
+      self.world.set_weather(weather)
+      self.rpcs["set_weather"] += 1
+      self._weather_values = values
+
+    # We turn off or on the lights depending on the sun altitude angle
+    self._update_lights(weather.sun_altitude_angle < 1)
+
+    self.rpcs_per_tick[sum(self.rpcs.values()) - nb_rpcs] += 1
+
+
+
+  def stats(self):
+    """Gets the counters of the calls to the simulator"""
+    total = sum(self.rpcs.values())
+    return {"ticks":self.nb_ticks, "rpcs":dict(self.rpcs), "rpcs_per_tick":total/max(1, self.nb_ticks),
+            "ticks_per_rpc_count":dict(sorted(self.rpcs_per_tick.items()))}
+
+
+
+  def _weather_changed(self, values):
+    if self._weather_values is None:
+      return True
+    # The sun angles are the two first parameters
+    if values[2:] != self._weather_values[2:]:
+      return True
+    return any(abs(value - previous) > self.sun_tolerance for value, previous in zip(values[:2], self._weather_values[:2]))
+
+
+
+  def _update_lights(self, lights_on):
+    new_lights = []
+    if self._ticks_since_refresh is None or self._ticks_since_refresh >= self.light_refresh_ticks:
+      lights = self.light_manager.get_all_lights()
+      self.rpcs["get_all_lights"] += 1
+      new_lights = [light for light in lights if light.id not in self._light_ids]
+      self._lights = lights
+      self._light_ids = set(light.id for light in lights)
+      self._ticks_since_refresh = 0
+    self._ticks_since_refresh += 1
+
+    if lights_on != self._lights_on:
+      # All the lights are switched
+      self.light_manager.set_active(self._lights, [lights_on]*len(self._lights))
+      self.rpcs["set_active"] += 1
+      self._lights_on = lights_on
+    elif new_lights:
+      # Only the lights which appeared since the last refresh are set
+      self.light_manager.set_active(new_lights, [lights_on]*len(new_lights))
+      self.rpcs["set_active"] += 1
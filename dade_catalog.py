@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Catalog of the frames of DADE dataset.
+
+The metadata of all the sequences (<sequence>.json, gnss.json, weather.json, the zones.json files of
+town12_zones.py and the metadata.csv file written by the generation) is gathered in a single file, with one typed column per
+field and one row per frame (numpy npz file). The frames can then be selected with array operations:
+    catalog = Catalog("catalog.npz")
+    frame_ids = catalog.query(weather_type="foggy", night=True, zone="Highway")
+    catalog.get_path(frame_ids[0], "semantic_masks_npz") # static_weather/<sequence>/semantic_masks_npz/001/000001.npz
+
+Script usage example:
+    python3 dade_catalog.py  dataset_root/DADE  catalog.npz  --csv dataset_root/metadata.csv  --zones-root zones_root
+"""
+
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+from dade_loader import find_sequences
+from town12_zones import UNKNOWN_ZONE, ZONES, ZONES_JSON
+from verify_dataset import FRAME_FOLDERS, get_frame_path
+
+# Weather parameters saved for each frame in weather.json
+WEATHER_PARAMETERS = ("sun_azimuth_angle", "sun_altitude_angle", "cloudiness", "precipitation", "precipitation_deposits",
+                      "wind_intensity", "fog_density", "fog_distance", "fog_falloff", "wetness", "scattering_intensity",
+                      "mie_scattering_scale", "rayleigh_scattering_scale")
+
+# Types of weather of the dynamic sequences (static sequences are clear), told apart halfway between
+# the values of the parameters of the clear weather and of the rainy or foggy weathers
+WEATHER_TYPES = ["clear", "rainy", "foggy"]
+RAINY_PRECIPITATION = 45.0
+FOGGY_FOG_DENSITY = 35.0
+
+SUBSETS = ["static_weather", "dynamic_weather"]
+
+
+def get_weather_types(precipitation, fog_density):
+    """Gets the type of weather (index in WEATHER_TYPES) of arrays of weather parameters"""
+    types = np.zeros(np.shape(precipitation), dtype=np.uint8)
+    types[np.asarray(precipitation) >= RAINY_PRECIPITATION] = WEATHER_TYPES.index("rainy")
+    types[np.asarray(fog_density) >= FOGGY_FOG_DENSITY] = WEATHER_TYPES.index("foggy")
+    return types
+
+
+def read_csv_metadata(path):
+    """Gets the metadata of the sequences from the csv file written by the generation, by sequence name"""
+    metadata = {}
+    with open(path, newline="") as fp:
+        for row in csv.reader(fp, delimiter=";"):
+            if len(row) >= 9:
+                name, map_name, seed, dynamic_weather, sun_altitude, cloudiness, nb_vehicles, nb_pedestrians, timestamp = row[:9]
+                metadata[name] = {"map": map_name, "seed": seed, "sun_altitude": float(sun_altitude), "cloudiness": float(cloudiness)}
+    return metadata
+
+
+def build_catalog(root, csv_path=None, zones_root=None):
+    """
+    Gets the columns of the catalog of the sequences under root. zones_root is the output folder of
+    town12_zones.py for the same root, if any (the zones are unknown otherwise).
+    """
+    csv_metadata = read_csv_metadata(csv_path) if csv_path is not None else {}
+    sequences = find_sequences(root)
+
+    columns = {name: [] for name in ["sequence", "frame", "x", "y", "z", "latitude", "longitude", "altitude", "zone"] + list(WEATHER_PARAMETERS)}
+    tables = {name: [] for name in ["name", "path", "subset", "map", "seed", "timestamp", "nb_vehicles", "nb_pedestrians"]}
+    for i, sequence in enumerate(sequences):
+        with open(os.path.join(sequence.path, sequence.name + ".json")) as fp:
+            metadata = json.load(fp)
+        extra = csv_metadata.get(sequence.name, {})
+        tables["name"].append(sequence.name)
+        tables["path"].append(os.path.relpath(sequence.path, root).replace(os.sep, "/"))
+        tables["subset"].append(SUBSETS.index(sequence.subset) if sequence.subset in SUBSETS else -1)
+        tables["map"].append(metadata.get("map", extra.get("map", "")))
+        tables["seed"].append(str(metadata.get("seed", extra.get("seed", ""))))
+        tables["timestamp"].append(metadata.get("timestamp", -1))
+        tables["nb_vehicles"].append(metadata.get("nb_vehicles", -1))
+        tables["nb_pedestrians"].append(metadata.get("nb_pedestrians", -1))
+
+        zones = {}
+        zones_path = os.path.join(zones_root, os.path.relpath(sequence.path, root), ZONES_JSON) if zones_root is not None else None
+        if zones_path is not None and os.path.isfile(zones_path):
+            with open(zones_path) as fp:
+                zones = json.load(fp)
+
+        for frame in sequence.frames:
+            gnss = sequence.gnss[str(frame)]
+            columns["sequence"].append(i)
+            columns["frame"].append(frame)
+            for name in ["x", "y", "z", "latitude", "longitude", "altitude"]:
+                columns[name].append(gnss[name])
+            zone = zones.get(str(frame))
+            columns["zone"].append(zone if zone is not None else UNKNOWN_ZONE)
+            # The static sequences only have the sun altitude and the cloudiness of the csv file
+            weather = sequence.weather.get(str(frame), {}) if sequence.weather is not None else {}
+            for name in WEATHER_PARAMETERS:
+                value = weather.get(name)
+                if value is None and name == "sun_altitude_angle":
+                    value = extra.get("sun_altitude")
+                if value is None and name == "cloudiness":
+                    value = extra.get("cloudiness")
+                columns[name].append(value if value is not None else np.nan)
+
+    catalog = {
+        "sequence": np.array(columns["sequence"], dtype=np.int32),
+        "frame": np.array(columns["frame"], dtype=np.int32),
+        "zone": np.array(columns["zone"], dtype=np.uint8),
+    }
+    for name in ["x", "y", "z", "latitude", "longitude", "altitude"]:
+        catalog[name] = np.array(columns[name], dtype=np.float64)
+    for name in WEATHER_PARAMETERS:
+        catalog[name] = np.array(columns[name], dtype=np.float32)
+    catalog["weather_type"] = get_weather_types(np.nan_to_num(catalog["precipitation"]), np.nan_to_num(catalog["fog_density"]))
+    for name in ["name", "path", "map", "seed"]:
+        catalog["sequence_" + name] = np.array(tables[name], dtype=str)
+    for name in ["subset", "timestamp", "nb_vehicles", "nb_pedestrians"]:
+        catalog["sequence_" + name] = np.array(tables[name], dtype=np.int32)
+    return catalog
+
+
+class Catalog:
+    """The catalog of the frames: a column per field, and a row per frame (the global frame identifier)"""
+
+    def __init__(self, path):
+        with np.load(path) as npz:
+            self.columns = {name: npz[name] for name in npz.files}
+
+    def __len__(self):
+        return len(self.columns["frame"])
+
+    def __getitem__(self, name):
+        """Gets a column, by frame. The columns of the sequences (sequence_*) are expanded to the frames."""
+        if name.startswith("sequence_"):
+            return self.columns[name][self.columns["sequence"]]
+        return self.columns[name]
+
+    def query(self, **filters):
+        """
+        Gets the identifiers of the frames matching all the filters, given by column name:
+        - a value (a column equal to the value), or a list of values (a column equal to one of them);
+        - a tuple (min, max) (a column between min and max, included, None for no bound);
+        - a function, which gets the column and returns a boolean array.
+        The zone, weather_type and subset can be given by name (e.g. zone="Highway"), the sequence by
+        name, and night=True/False selects the frames with the sun below/above the horizon.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            if name == "night":
+                column, value = self["sun_altitude_angle"] < 0, bool(value)
+            elif name == "sequence" and isinstance(value, str):
+                column = self["sequence_name"]
+            elif name in ["map", "subset", "timestamp", "nb_vehicles", "nb_pedestrians", "seed", "path", "name"]:
+                column = self["sequence_" + name]
+            else:
+                column = self[name]
+            value = self._get_value(name, value)
+
+            if callable(value):
+                mask &= value(column)
+            elif isinstance(value, tuple):
+                if value[0] is not None:
+                    mask &= column >= value[0]
+                if value[1] is not None:
+                    mask &= column <= value[1]
+            elif isinstance(value, list):
+                mask &= np.isin(column, value)
+            else:
+                mask &= column == value
+        return np.flatnonzero(mask)
+
+    def get_record(self, frame_id):
+        """Gets the values of all the fields of a frame"""
+        sequence = self.columns["sequence"][frame_id]
+        record = {}
+        for name, column in self.columns.items():
+            value = column[sequence] if name.startswith("sequence_") else column[frame_id]
+            record[name] = value.item()
+        return record
+
+    def get_path(self, frame_id, modality):
+        """Gets the path (relative to the dataset folder) of the file of a frame, for a frame folder (e.g. semantic_masks_npz)"""
+        sequence = self.columns["sequence"][frame_id]
+        return "{}/{}".format(self.columns["sequence_path"][sequence], get_frame_path(modality, int(self.columns["frame"][frame_id]), FRAME_FOLDERS[modality]))
+
+    def _get_value(self, name, value):
+        names = {"zone": [zone_name for _, zone_name, _ in ZONES], "weather_type": WEATHER_TYPES, "subset": SUBSETS}
+        if name not in names:
+            return value
+        if isinstance(value, str):
+            return names[name].index(value)
+        if isinstance(value, list):
+            return [names[name].index(v) if isinstance(v, str) else v for v in value]
+        return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the catalog of the frames of DADE dataset.")
+    parser.add_argument("root", help="dataset folder (or subset or sequence folder).")
+    parser.add_argument("output", nargs="?", default="catalog.npz", help="catalog to create (default: catalog.npz).")
+    parser.add_argument("--csv", type=str, default=None, help="csv file written by the generation, for the weather of the static sequences.")
+    parser.add_argument("--zones-root", type=str, default=None, help="folder of the zones.json files written by town12_zones.py for the same root.")
+    args = parser.parse_args()
+
+    catalog = build_catalog(args.root, args.csv, args.zones_root)
+    np.savez(args.output, **catalog)
+    print("Catalog of {} frames of {} sequences saved in {}".format(len(catalog["frame"]), len(catalog["sequence_name"]), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+Data loader for DADE dataset.
+
+The loader reads the frames of the sequences of the dataset (static_weather and/or dynamic_weather):
+the RGB image (from the images folder, or from the video of the sequence), the class-ID mask (from
+the packed array of dade_memmap.py if memmap_root is given, or from semantic_masks_npz), and the GNSS and weather data
+of the frame. The frames are read by batches, in the order of the sequences or shuffled, by a pool of
+threads which prepares the next batches while the current one is used. By default, the arrays of the
+batches are reused: a batch is only valid until the next batches are requested.
+
+Usage example:
+    loader = DADELoader("dataset_root/DADE", mode="shuffled", batch_size=8, workers=8, prefetch=4)
+    for epoch in range(nb_epochs):
+        for batch in loader:
+            batch["image"], batch["mask"] # Arrays of shape (8, 720, 1280, 3) and (8, 720, 1280)
+
+Running the script measures the throughput of the loader:
+    python3 dade_loader.py dataset_root/DADE --mode shuffled --batch-size 8 --workers 8
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from dade_memmap import ARRAY_NAME, MemmapLabels, load_mask
+from verify_dataset import get_frame_path
+
+SUBSETS = ("static_weather", "dynamic_weather")
+MODALITIES = ("image", "mask", "gnss", "weather")
+MAX_OPEN_VIDEOS = 4 # Videos kept open by each thread
+
+
+class DADESequence:
+    """A sequence of the dataset: its frames, its metadata, and the readers of its images and masks"""
+
+    def __init__(self, path, memmap_dir=None):
+        """memmap_dir is the folder of the packed masks of the sequence (dade_memmap.py), if any"""
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.subset = os.path.basename(os.path.dirname(os.path.normpath(path)))
+        with open(os.path.join(path, "gnss.json")) as fp:
+            self.gnss = json.load(fp)
+        self.frames = sorted(int(frame) for frame in self.gnss)
+        self.weather = None
+        if os.path.isfile(os.path.join(path, "weather.json")):
+            with open(os.path.join(path, "weather.json")) as fp:
+                self.weather = json.load(fp)
+
+        self.video_path = os.path.join(path, self.name + ".mp4")
+        self.has_images = os.path.isdir(os.path.join(path, "images"))
+        self.masks = None
+        if memmap_dir is not None and os.path.isfile(os.path.join(memmap_dir, ARRAY_NAME)):
+            self.masks = MemmapLabels(os.path.join(memmap_dir, ARRAY_NAME))
+
+    def read_mask(self, frame):
+        """Gets the class-ID mask of a frame"""
+        if self.masks is not None:
+            return self.masks.frame(frame)
+        return load_mask(os.path.join(self.path, get_frame_path("semantic_masks_npz", frame, ".npz")))
+
+    def read_images(self, frames, videos):
+        """Gets the RGB images of some frames, from the images folder or from the video (videos holds the open videos of the thread)"""
+        if self.has_images:
+            images = []
+            for frame in frames:
+                with Image.open(os.path.join(self.path, get_frame_path("images", frame, ".png"))) as image:
+                    images.append(np.asarray(image.convert("RGB")))
+            return images
+
+        # The video readers are imported only when needed, as they require PyAV
+        from dade_video import VideoFrames
+        if self.video_path not in videos:
+            if len(videos) >= MAX_OPEN_VIDEOS:
+                videos.pop(next(iter(videos))).close()
+            videos[self.video_path] = VideoFrames(self.video_path)
+        return videos[self.video_path].get_batch(frames)
+
+
+def find_sequences(root, subsets=SUBSETS, memmap_root=None):
+    """
+    Gets the sequences under a dataset folder, a subset folder (e.g. static_weather) or a sequence folder.
+    memmap_root is the output folder of dade_memmap.py for the same root, if any.
+    """
+    def get_memmap_dir(path):
+        return os.path.join(memmap_root, os.path.relpath(path, root)) if memmap_root is not None else None
+
+    if os.path.isfile(os.path.join(root, "gnss.json")):
+        return [DADESequence(root, get_memmap_dir(root))]
+    folders = [os.path.join(root, subset) for subset in subsets if os.path.isdir(os.path.join(root, subset))]
+    if not folders:
+        folders = [root]
+    sequences = []
+    for folder in folders:
+        for name in sorted(os.listdir(folder)):
+            if os.path.isfile(os.path.join(folder, name, "gnss.json")):
+                sequences.append(DADESequence(os.path.join(folder, name), get_memmap_dir(os.path.join(folder, name))))
+    return sequences
+
+
+class DADELoader:
+    """Iterates over batches of frames of DADE sequences, prepared by a pool of threads"""
+
+    def __init__(self, root, mode="sequential", batch_size=1, modalities=MODALITIES, workers=4, prefetch=4,
+                 subsets=SUBSETS, seed=None, reuse_buffers=True, drop_last=False, memmap_root=None):
+        """
+        In "sequential" mode, the frames are read in order, sequence after sequence. In "shuffled" mode,
+        they are read in a random order, which changes at each epoch. At most prefetch batches are
+        prepared in advance by the workers. The masks are read from the packed arrays of dade_memmap.py
+        written in memmap_root, if given.
+        """
+        if mode not in ["sequential", "shuffled"]:
+            raise Exception("Unknown mode {}!".format(mode))
+        for modality in modalities:
+            if modality not in MODALITIES:
+                raise Exception("Unknown modality {}!".format(modality))
+        self.sequences = find_sequences(root, subsets, memmap_root)
+        self.samples = [(sequence, frame) for sequence in self.sequences for frame in sequence.frames]
+        self.mode = mode
+        self.batch_size = batch_size
+        self.modalities = modalities
+        self.workers = max(1, workers)
+        self.prefetch = max(1, prefetch)
+        self.reuse_buffers = reuse_buffers
+        self.drop_last = drop_last
+        self._random = random.Random(seed)
+        self._local = threading.local()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.samples) // self.batch_size
+        return -(-len(self.samples) // self.batch_size)
+
+    def __iter__(self):
+        samples = list(self.samples)
+        if self.mode == "shuffled":
+            self._random.shuffle(samples)
+        batches = [samples[i:i + self.batch_size] for i in range(0, len(samples), self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+
+        # Each batch is written in the buffers of a slot. A slot is reused once the batch it held was
+        # yielded and the next one was requested.
+        slots = [{} for _ in range(self.prefetch + 2)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for i, batch in enumerate(batches):
+                pending.append(executor.submit(self._load_batch, batch, slots[i % len(slots)]))
+                if len(pending) > self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _get_buffer(self, slot, name, array):
+        shape = (self.batch_size,) + array.shape
+        if not self.reuse_buffers:
+            return np.empty(shape, dtype=array.dtype)
+        if name not in slot or slot[name].shape != shape or slot[name].dtype != array.dtype:
+            slot[name] = np.empty(shape, dtype=array.dtype)
+        return slot[name]
+
+    def _load_batch(self, batch, slot):
+        nb_samples = len(batch)
+        data = {"sequence": [sequence.name for sequence, _ in batch], "frame": np.array([frame for _, frame in batch])}
+        if "gnss" in self.modalities:
+            data["gnss"] = [sequence.gnss[str(frame)] for sequence, frame in batch]
+        if "weather" in self.modalities:
+            data["weather"] = [sequence.weather[str(frame)] if sequence.weather is not None else None for sequence, frame in batch]
+
+        if "mask" in self.modalities:
+            for i, (sequence, frame) in enumerate(batch):
+                mask = sequence.read_mask(frame)
+                if i == 0:
+                    masks = self._get_buffer(slot, "mask", mask)
+                masks[i] = mask
+            data["mask"] = masks[:nb_samples]
+
+        if "image" in self.modalities:
+            # The images of a sequence are read together, so that the frames of a video are decoded in order
+            if not hasattr(self._local, "videos"):
+                self._local.videos = {}
+            positions = {}
+            for i, (sequence, frame) in enumerate(batch):
+                positions.setdefault(sequence, []).append((i, frame))
+            images = None
+            for sequence, sequence_positions in positions.items():
+                for (i, _), image in zip(sequence_positions, sequence.read_images([frame for _, frame in sequence_positions], self._local.videos)):
+                    if images is None:
+                        images = self._get_buffer(slot, "image", image)
+                    images[i] = image
+            data["image"] = images[:nb_samples]
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the throughput of the DADE data loader.")
+    parser.add_argument("root", help="dataset folder, subset folder or sequence folder.")
+    parser.add_argument("--mode", type=str, default="sequential", choices=["sequential", "shuffled"], help="order of the frames (default: sequential).")
+    parser.add_argument("--batch-size", type=int, default=8, help="number of frames per batch (default: 8).")
+    parser.add_argument("--modalities", type=str, nargs="+", default=list(MODALITIES), choices=MODALITIES, help="data to read (default: all).")
+    parser.add_argument("--workers", type=int, default=4, help="number of threads reading the frames (default: 4).")
+    parser.add_argument("--prefetch", type=int, default=4, help="number of batches prepared in advance (default: 4).")
+    parser.add_argument("--memmap-root", type=str, default=None, help="output folder of dade_memmap.py, to read the packed masks (default: none).")
+    parser.add_argument("--max-batches", type=int, default=None, help="number of batches to read (default: all).")
+    args = parser.parse_args()
+
+    loader = DADELoader(args.root, args.mode, args.batch_size, args.modalities, args.workers, args.prefetch, memmap_root=args.memmap_root)
+    print("{} sequences, {} frames, {} batches".format(len(loader.sequences), len(loader.samples), len(loader)))
+    nb_frames = 0
+    start = time.perf_counter()
+    for i, batch in enumerate(loader):
+        nb_frames += len(batch["frame"])
+        if args.max_batches is not None and i + 1 >= args.max_batches:
+            break
+    duration = time.perf_counter() - start
+    print("Read {} frames in {:.1f} s ({:.1f} frames/s)".format(nb_frames, duration, nb_frames / max(duration, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Memory-mapped label arrays for DADE sequences.
+
+The class-ID masks of a sequence (semantic_masks_npz) are packed into a single uint8 array of shape
+(nb_frames, 720, 1280), saved as a .npy file (a small header followed by the raw masks). The array is
+then memory-mapped: a frame, or a range of consecutive frames, is a view of the file, without any
+decoding, and the masks read repeatedly are served by the page cache of the OS.
+
+Script usage example:
+    python3 dade_memmap.py  dataset_root/DADE  \       # all the sequences (or a single one)
+                            memmap_root                # where to write the arrays
+
+The arrays are written in a separate folder, with the same layout as the dataset folder
+(memmap_root/<subset>/<sequence>/semantic_masks.npy), so that the dataset folder is left as downloaded.
+The frame k of a sequence is at index k-1 of its array.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+
+import numpy as np
+
+from verify_dataset import find_sequences, get_frame_path, list_files
+
+ARRAY_NAME = "semantic_masks.npy"
+
+
+def get_frames(sequence_dir):
+    """Gets the number of frames of a sequence (from gnss.json), checking that they are numbered from 1"""
+    with open(os.path.join(sequence_dir, "gnss.json")) as fp:
+        frames = sorted(int(frame) for frame in json.load(fp))
+    if frames != list(range(1, len(frames) + 1)):
+        raise Exception("The frames of {} are not numbered from 1 to {}!".format(sequence_dir, len(frames)))
+    return len(frames)
+
+
+def load_mask(path):
+    """Loads the class-ID mask of a frame from its npz file (which holds a single array)"""
+    with np.load(path) as npz:
+        return npz[npz.files[0]]
+
+
+def pack_sequence(sequence_dir, output_path, nb_workers=8, force=False):
+    """Packs the masks of a sequence into a .npy file. Returns False if the file was already up to date."""
+    nb_frames = get_frames(sequence_dir)
+    paths = [os.path.join(sequence_dir, get_frame_path("semantic_masks_npz", frame, ".npz")) for frame in range(1, nb_frames + 1)]
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        raise Exception("{} masks of {} are missing, e.g. {}!".format(len(missing), sequence_dir, missing[0]))
+    if not force and os.path.isfile(output_path) and len(np.load(output_path, mmap_mode="r")) == nb_frames \
+            and os.path.getmtime(output_path) >= max(os.path.getmtime(path) for path in paths):
+        return False
+
+    first = load_mask(paths[0])
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    # The array is written next to its final location, so that a reader never sees it half-written
+    array = np.lib.format.open_memmap(output_path + ".tmp", mode="w+", dtype=np.uint8, shape=(nb_frames,) + first.shape)
+
+    def pack(i):
+        array[i] = first if i == 0 else load_mask(paths[i])
+
+    with ThreadPoolExecutor(max_workers=max(1, nb_workers)) as executor:
+        list(executor.map(pack, range(nb_frames)))
+    array.flush()
+    del array
+    os.replace(output_path + ".tmp", output_path)
+    return True
+
+
+class MemmapLabels:
+    """The class-ID masks of a sequence, memory-mapped from its packed array"""
+
+    def __init__(self, path):
+        """Maps the array of a sequence, given by its .npy file or by the folder holding it"""
+        if os.path.isdir(path):
+            path = os.path.join(path, ARRAY_NAME)
+        self.path = path
+        self.array = np.load(path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.array)
+
+    def frame(self, frame):
+        """Gets the mask of a frame (numbered from 1), as a read-only view"""
+        if frame < 1 or frame > len(self.array):
+            raise IndexError("Frame {} not in 1..{}".format(frame, len(self.array)))
+        return self.array[frame - 1]
+
+    def frames(self, start, stop):
+        """Gets the masks of the frames start to stop (excluded), as a read-only view of shape (stop-start, H, W)"""
+        if start < 1 or stop > len(self.array) + 1 or start > stop:
+            raise IndexError("Frames {}..{} not in 1..{}".format(start, stop - 1, len(self.array)))
+        return self.array[start - 1:stop - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packs the masks of DADE sequences into memory-mapped arrays.")
+    parser.add_argument("root", help="dataset folder or sequence folder.")
+    parser.add_argument("output", help="folder where the arrays are written, by sequence (outside of the dataset folder).")
+    parser.add_argument("--workers", type=int, default=8, help="number of masks decoded in parallel (default: 8).")
+    parser.add_argument("--force", action="store_true", help="packs the sequences again, even if their array is up to date.")
+    args = parser.parse_args()
+
+    for sequence in find_sequences(list_files(args.root)):
+        output_dir = os.path.join(args.output, sequence)
+        if pack_sequence(os.path.join(args.root, sequence), os.path.join(output_dir, ARRAY_NAME), args.workers, args.force):
+            print("Packed {}".format(sequence or args.root))
+        else:
+            print("{} is up to date".format(sequence or args.root))
+
+
+if __name__ == "__main__":
+    main()
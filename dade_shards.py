@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+Sharded format for DADE sequences.
+
+Each sequence folder is stored in a few large tar files (shards), which hold all the files of the
+sequence: the frames (RGB images, if any, and the three variants of the semantic masks), ordered frame
+by frame, after the other files (video, json files with the metadata of the sequence and of each frame).
+An index (index.json, next to the shards) gives the position of each file in the shards, so that any
+file can be read with a single seek, while reading the shards from start to end reads all the frames
+in order.
+
+Script usage example:
+    python3 dade_shards.py  export  dataset_root/DADE  sharded_root     # all the sequences (or a single one)
+    python3 dade_shards.py  unpack  sharded_root/static_weather/sequence  sequence_folder
+
+A sequence unpacked from its shards is identical to the original sequence folder (hidden files excepted).
+"""
+
+import argparse
+import json
+import os
+import re
+import tarfile
+
+from verify_dataset import FRAME_FOLDERS, find_sequences, get_frame_path, list_files
+
+INDEX_NAME = "index.json"
+SHARD_SIZE = 1 << 30
+TAR_BLOCK_SIZE = 512
+
+_FRAME_FILE = re.compile(r"^({})/\d{{3}}/(\d{{6}})\.\w+$".format("|".join(FRAME_FOLDERS)))
+
+
+def get_file_order(path):
+    """Gets the key ordering the files of a sequence in its shards: the other files first, then the frames in order"""
+    match = _FRAME_FILE.match(path)
+    if match is None:
+        return (0, 0, 0, path)
+    return (1, int(match.group(2)), list(FRAME_FOLDERS).index(match.group(1)), path)
+
+
+def export_sequence(sequence_dir, output_dir, shard_size=SHARD_SIZE):
+    """Stores the files of a sequence folder in shards of about shard_size bytes, and writes their index"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(list_files(sequence_dir), key=get_file_order)
+
+    shards = []
+    files = []
+    tar = None
+    try:
+        for path in paths:
+            if tar is None or tar.offset >= shard_size:
+                if tar is not None:
+                    tar.close()
+                shards.append("shard-{:05d}.tar".format(len(shards)))
+                tar = tarfile.open(os.path.join(output_dir, shards[-1]), "w", format=tarfile.PAX_FORMAT)
+            full_path = os.path.join(sequence_dir, path)
+            info = tar.gettarinfo(full_path, arcname=path)
+            with open(full_path, "rb") as fp:
+                tar.addfile(info, fp)
+            # The data of the file is just before the end of the archive, padded to a whole block
+            offset = tar.offset - -(-info.size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+            files.append([path, len(shards) - 1, offset, info.size])
+    finally:
+        if tar is not None:
+            tar.close()
+
+    frames = sorted(set(int(match.group(2)) for match in map(_FRAME_FILE.match, paths) if match is not None))
+    index = {"sequence": os.path.basename(os.path.normpath(sequence_dir)), "shards": shards, "files": files, "frames": frames}
+    with open(os.path.join(output_dir, INDEX_NAME), "w") as fp:
+        json.dump(index, fp)
+    return index
+
+
+class ShardedSequence:
+    """A sequence stored in shards, whose files can be read by path or by frame"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_NAME)) as fp:
+            index = json.load(fp)
+        self.name = index["sequence"]
+        self.shards = index["shards"]
+        self.frames = index["frames"]
+        self.files = {file_path: (shard, offset, size) for file_path, shard, offset, size in index["files"]}
+        self._handles = {}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, file_path):
+        """Gets the content of a file of the sequence, given by its path in the sequence folder"""
+        shard, offset, size = self.files[file_path]
+        if shard not in self._handles:
+            self._handles[shard] = open(os.path.join(self.path, self.shards[shard]), "rb")
+        handle = self._handles[shard]
+        handle.seek(offset)
+        return handle.read(size)
+
+    def read_json(self, file_path):
+        """Gets the content of a json file of the sequence"""
+        return json.loads(self.read(file_path))
+
+    def read_frame(self, frame, folders=None):
+        """Gets the content of the files of a frame, by folder (all the frame folders of the sequence, if None)"""
+        data = {}
+        for folder in folders if folders is not None else FRAME_FOLDERS:
+            file_path = get_frame_path(folder, frame, FRAME_FOLDERS[folder])
+            if file_path in self.files:
+                data[folder] = self.read(file_path)
+        return data
+
+    def stream(self):
+        """Reads the shards from start to end, and yields the path and the content of each file"""
+        for shard in self.shards:
+            with tarfile.open(os.path.join(self.path, shard), "r|") as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield member.name, tar.extractfile(member).read()
+                    tar.members = []
+
+    def unpack(self, output_dir):
+        """Writes the files of the sequence back to a sequence folder"""
+        for file_path, data in self.stream():
+            full_path = os.path.join(output_dir, file_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as fp:
+                fp.write(data)
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts DADE sequences to and from the sharded format.")
+    parser.add_argument("command", choices=["export", "unpack"], help="export sequence folders to shards, or unpack shards to a sequence folder.")
+    parser.add_argument("input", help="dataset folder or sequence folder (export), sharded sequence (unpack).")
+    parser.add_argument("output", help="output folder.")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="size of the shards, in bytes (default: 1 GB).")
+    args = parser.parse_args()
+
+    if args.command == "unpack":
+        sequence = ShardedSequence(args.input)
+        sequence.unpack(args.output)
+        print("Unpacked {} ({} frames) in {}".format(sequence.name, len(sequence), args.output))
+        return
+
+    for sequence in find_sequences(list_files(args.input)):
+        output_dir = os.path.join(args.output, sequence)
+        index = export_sequence(os.path.join(args.input, sequence), output_dir, args.shard_size)
+        print("Exported {} ({} frames) in {} shards".format(sequence or args.input, len(index["frames"]), len(index["shards"])))
+
+
+if __name__ == "__main__":
+    main()
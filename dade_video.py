@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+Random access to the frames of the RGB videos of DADE sequences (<sequence>.mp4).
+
+An index of each video gives, for every frame, the timestamp (pts), the position in the file and the
+keyframe flag of its packet. It is built once by reading the packets of the video (without decoding
+them), and saved next to the video (<sequence>.mp4.index.json). To get a frame, the reader seeks to
+the keyframe preceding it and decodes the frames in between only. A batch of frames is decoded in
+order, with a single seek per group of pictures.
+
+Script usage example:
+    python3 dade_video.py  dataset_root/DADE          # indexes the videos of all the sequences (or of a single one)
+
+The frame k of a sequence is the k-th frame of its video. The PyAV package is needed (pip3 install av).
+"""
+
+import argparse
+import bisect
+import json
+import os
+
+import av
+
+
+def get_index_path(video_path):
+    """Gets the path of the index of a video"""
+    return video_path + ".index.json"
+
+
+def build_index(video_path):
+    """
+    Gets the index of a video: the time base of its stream, and the pts, position and keyframe flag of
+    the packet of each frame, in presentation order.
+    """
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        frames = [[packet.pts, packet.pos, bool(packet.is_keyframe)] for packet in container.demux(stream) if packet.pts is not None]
+        time_base = [stream.time_base.numerator, stream.time_base.denominator]
+    frames.sort()
+    return {"time_base": time_base, "frames": frames}
+
+
+def load_index(video_path, rebuild=False):
+    """Loads the index of a video, building and saving it if needed"""
+    index_path = get_index_path(video_path)
+    if not rebuild and os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(video_path):
+        with open(index_path) as fp:
+            return json.load(fp)
+    index = build_index(video_path)
+    with open(index_path + ".tmp", "w") as fp:
+        json.dump(index, fp)
+    os.replace(index_path + ".tmp", index_path)
+    return index
+
+
+class VideoFrames:
+    """The frames of a video, decoded on demand with the help of its index"""
+
+    def __init__(self, video_path, pixel_format="rgb24"):
+        self.video_path = video_path
+        self.pixel_format = pixel_format
+        index = load_index(video_path)
+        self.pts = [pts for pts, _, _ in index["frames"]]
+        self.keyframes = [i for i, (_, _, keyframe) in enumerate(index["frames"]) if keyframe]
+        self._container = None
+        self._stream = None
+        self._decoder = None
+        self._position = None # Index of the last frame decoded, if the decoder can go on from there
+
+        # Counters, to check the cost of the accesses
+        self.nb_seeks = 0
+        self.nb_decoded = 0
+
+    def __len__(self):
+        return len(self.pts)
+
+    def get(self, frame):
+        """Gets a frame (numbered from 1), as an array of shape (H, W, 3)"""
+        return self.get_batch([frame])[0]
+
+    def get_batch(self, frames):
+        """
+        Gets several frames (numbered from 1), in the given order. The frames are decoded in increasing
+        order, seeking only when the next frame is not in the group of pictures being decoded.
+        """
+        images = {}
+        for frame in sorted(set(frames)):
+            if frame < 1 or frame > len(self.pts):
+                raise IndexError("Frame {} not in 1..{}".format(frame, len(self.pts)))
+            images[frame] = self._decode(frame - 1)
+        return [images[frame] for frame in frames]
+
+    def close(self):
+        if self._container is not None:
+            self._container.close()
+        self._container = None
+        self._decoder = None
+        self._position = None
+
+    def _get_keyframe(self, i):
+        return self.keyframes[max(0, bisect.bisect_right(self.keyframes, i) - 1)] if self.keyframes else 0
+
+    def _decode(self, i):
+        # We seek to the keyframe preceding the frame, unless the decoder reaches the frame sooner
+        keyframe = self._get_keyframe(i)
+        if self._position is None or self._position >= i or self._position < keyframe - 1:
+            if self._container is None:
+                self._container = av.open(self.video_path)
+                self._stream = self._container.streams.video[0]
+            self._container.seek(self.pts[keyframe], stream=self._stream, backward=True, any_frame=False)
+            self._decoder = self._container.decode(self._stream)
+            self._position = None
+            self.nb_seeks += 1
+
+        target = self.pts[i]
+        for image in self._decoder:
+            self.nb_decoded += 1
+            if image.pts is None or image.pts < target:
+                continue
+            if image.pts != target:
+                # The frame is missing from the stream: the next frame must not be returned in its place
+                self._position = None
+                raise Exception("Frame {} (pts {}) not found in {}: the stream goes on at pts {}!".format(i + 1, target, self.video_path, image.pts))
+            self._position = i
+            return image.to_ndarray(format=self.pixel_format)
+        self._position = None
+        raise Exception("Frame {} not found in {}!".format(i + 1, self.video_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the frame index of the videos of DADE sequences.")
+    parser.add_argument("root", help="dataset folder or sequence folder.")
+    parser.add_argument("--rebuild", action="store_true", help="builds the indexes again, even if they are up to date.")
+    args = parser.parse_args()
+
+    for folder, dirs, file_names in os.walk(args.root):
+        dirs.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(".mp4"):
+                index = load_index(os.path.join(folder, file_name), args.rebuild)
+                nb_keyframes = sum(keyframe for _, _, keyframe in index["frames"])
+                print("{}: {} frames, {} keyframes".format(os.path.join(folder, file_name), len(index["frames"]), nb_keyframes))
+
+
+if __name__ == "__main__":
+    main()
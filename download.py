@@ -6,16 +6,33 @@ Download script for DADE dataset.
 The data is released under a Creative Commons Attribution-NonCommercial-ShareAlike 4.0 License.
 
 Script usage example:
-    python3 download.py  --dade  "all" \         # subset to download. Options: "static", "dynamic", or "all" 
+    python3 download.py  --dade  "all" \         # subset to download. Options: "static", "dynamic", or "all"
+                         --jobs 4 \              # number of files downloaded in parallel
                          dataset_root            # path where to store the downloaded data
 
+The archives are extracted while they are downloaded, so that they are never written to disk. An
+interrupted download is resumed (with HTTP Range requests) after the last member of the archive that
+was extracted. Downloads that completed are marked by a .done file in the dataset folder.
+
+Only some sequences and modalities can be downloaded, for instance:
+    python3 download.py  dataset_root  --dade  "dynamic" --modalities semantic_masks_npz json
+The members of the archives are then fetched with HTTP Range requests, using an index of the offsets
+of the members of each archive (<archive>.index.json, in the dataset folder or in --index-dir). The
+index of an archive is built once from the whole archive if it is missing (the selected members are
+then extracted during the same pass, so that they are not downloaded twice), or from a local copy with:
+    python3 download.py  --build-index path/to/static_weather.tar dataset_root
 """
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
 import os
 import sys
-import wget
 import tarfile
+import threading
+import time
+import urllib.request
 
 BASE_URL = "https://dataverse.uliege.be/api/access/datafile/"
 
@@ -26,70 +43,400 @@ DYNAMIC_1_URL = "28014"
 DYNAMIC_2_URL = "28015"
 DYNAMIC_3_URL = "28016"
 
+# Archives of each subset: name, file identifier, and folder (in the dataset folder) where it is extracted
+STATIC_ARCHIVES = [("static_weather.tar", STATIC_URL, "")]
+DYNAMIC_ARCHIVES = [
+    ("dynamic_weather_part1.tar", DYNAMIC_1_URL, "dynamic_weather"),
+    ("dynamic_weather_part2.tar", DYNAMIC_2_URL, "dynamic_weather"),
+    ("dynamic_weather_part3.tar", DYNAMIC_3_URL, "dynamic_weather"),
+]
+
+# Modalities of a sequence which can be selected: the RGB video, the folders of semantic masks, and the json files
+MODALITIES = ["rgb", "semantic_masks", "semantic_masks_npz", "semantic_masks_carla", "json"]
+
+CHUNK_SIZE = 1 << 20
+STATE_SAVE_INTERVAL = 5.0 # Seconds between two saves of the position of an archive download
+TAR_BLOCK_SIZE = 512
+
+
+class Progress:
+    """Aggregate throughput of the downloads in progress, printed every second"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.nb_bytes = 0
+        self.totals = {}
+        self.start_time = time.monotonic()
+
+    def add(self, nb_bytes):
+        with self._lock:
+            self.nb_bytes += nb_bytes
+
+    def set_total(self, name, total):
+        with self._lock:
+            self.totals[name] = total
+
+    def report(self):
+        duration = max(time.monotonic() - self.start_time, 1e-9)
+        line = " Downloaded {:.2f} GB at {:.1f} MB/s".format(self.nb_bytes/1e9, self.nb_bytes/duration/1e6)
+        total = sum(total for total in self.totals.values() if total is not None)
+        if total > 0:
+            line += " (about {:.2f} GB to download)".format(total/1e9)
+        return line
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        print("\r" + self.report())
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            print("\r" + self.report(), end="", flush=True)
+
+
+class CountingReader:
+    """A file-like wrapper of an HTTP response, counting the bytes read"""
+
+    def __init__(self, response, progress):
+        self.response = response
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.response.read(size)
+        self.progress.add(len(data))
+        return data
+
+
+def open_url(url, start=0, end=None):
+    """Opens an URL, from the byte start to the byte end (included, None for the end of the file)"""
+    request = urllib.request.Request(url)
+    if start > 0 or end is not None:
+        request.add_header("Range", "bytes={}-{}".format(start, "" if end is None else end))
+    return urllib.request.urlopen(request, timeout=60)
+
+
+def get_remaining_size(response):
+    """Gets the number of bytes that an HTTP response will send, or None if it is unknown"""
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+
+def retry(function, name, retries):
+    """Calls function until it succeeds, at most retries+1 times"""
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except (OSError, http.client.HTTPException, tarfile.ReadError) as e:
+            if attempt == retries:
+                raise
+            delay = min(60, 2**attempt)
+            print("\n {}: {}, resuming in {} s".format(name, e, delay))
+            time.sleep(delay)
+
+
+def download_file(url, path, progress, retries=5):
+    """Downloads a file to the given path, resuming the previous download (.part file) if any"""
+    part_path = path + ".part"
+
+    def download():
+        start = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        with open_url(url, start) as response:
+            mode = "ab" if start > 0 and response.status == 206 else "wb" # The server may not support resuming
+            progress.set_total(path, get_remaining_size(response))
+            with open(part_path, mode) as fp:
+                while True:
+                    data = response.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    fp.write(data)
+                    progress.add(len(data))
+        os.replace(part_path, path)
+        progress.set_total(path, None)
+
+    retry(download, os.path.basename(path), retries)
+
+
+def read_state(state_path):
+    """Gets the offset in its archive of the first member that was not extracted yet"""
+    try:
+        with open(state_path) as fp:
+            return json.load(fp)["offset"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0
+
+
+def write_state(state_path, offset):
+    """Saves the offset in its archive of the first member that was not extracted yet"""
+    with open(state_path + ".tmp", "w") as fp:
+        json.dump({"offset": offset}, fp)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def extract_member(tar, member, out_dir):
+    """Extracts a member of an archive (with the "data" filter of tarfile, if available)"""
+    if hasattr(tarfile, "data_filter"):
+        tar.extract(member, out_dir, filter="data")
+    else:
+        tar.extract(member, out_dir)
+
+
+def extract_stream(fileobj, out_dir, offset=0, state_path=None, members=None):
+    """
+    Extracts an archive from a stream, starting at the given offset (which must be the one of a member).
+    The offset of the next member is saved regularly in the state file, so that the extraction can be
+    resumed (and when the extraction stops). If members is given, only the members whose names are in it are extracted.
+    Returns the offset of the end of the archive.
+    """
+    next_offset = offset
+    last_save = time.monotonic()
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+            for member in tar:
+                if members is None or member.name in members:
+                    extract_member(tar, member, out_dir)
+                next_offset = offset + member.offset_data
+                if member.isfile():
+                    next_offset += -(-member.size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+                tar.members = [] # Otherwise, all the members read from the stream are kept in memory
+                if state_path is not None and time.monotonic() - last_save > STATE_SAVE_INTERVAL:
+                    write_state(state_path, next_offset)
+                    last_save = time.monotonic()
+    finally:
+        # The position is also saved if the download is interrupted
+        if state_path is not None:
+            write_state(state_path, next_offset)
+    return next_offset
+
+
+def download_archive(url, name, out_dir, dataset_dir, progress, retries=5):
+    """Downloads an archive and extracts it on the fly, resuming the previous download if any"""
+    state_path = os.path.join(dataset_dir, "." + name + ".state")
+    done_path = os.path.join(dataset_dir, "." + name + ".done")
+    os.makedirs(out_dir, exist_ok=True)
+
+    def download():
+        offset = read_state(state_path)
+        with open_url(url, offset) as response:
+            if offset > 0 and response.status != 206:
+                print("\n {}: the server does not support resuming, restarting from the beginning".format(name))
+                offset = 0
+            progress.set_total(name, get_remaining_size(response))
+            extract_stream(CountingReader(response, progress), out_dir, offset, state_path)
+        progress.set_total(name, None)
+
+    print("\n Downloading and extracting {}".format(name))
+    retry(download, name, retries)
+    open(done_path, "w").close()
+    if os.path.isfile(state_path):
+        os.remove(state_path)
+    print("\n Extracted {}".format(name))
+
+
+def get_member_selection_key(name):
+    """Gets the sequence and the modality of a member of an archive, or None if it is not part of a sequence"""
+    parts = name.split("/")
+    for i in range(len(parts) - 1):
+        child = parts[i + 1]
+        if child in MODALITIES and i + 2 < len(parts):
+            return parts[i], child
+        if i + 2 == len(parts):
+            if child.endswith(".mp4"):
+                return parts[i], "rgb"
+            if child.endswith(".json"):
+                return parts[i], "json"
+    return None
+
+
+def is_selected(name, sequences=None, modalities=None):
+    """Checks if a member of an archive is part of the given sequences and modalities (all of them if None)"""
+    key = get_member_selection_key(name)
+    return key is not None and not (sequences and key[0] not in sequences) and not (modalities and key[1] not in modalities)
+
+
+def is_extracted(out_dir, name, size):
+    """Checks if a file of an archive was already extracted"""
+    path = os.path.join(out_dir, name)
+    return os.path.isfile(path) and os.path.getsize(path) == size
+
+
+def build_index(fileobj, out_dir=None, sequences=None, modalities=None):
+    """
+    Reads an archive from a stream, and gets the index of its files: for each of them, its name, the
+    offset of its header, the offset of its data and its size. If out_dir is given, the files of the
+    given sequences and modalities are extracted in it while the archive is read.
+    """
+    index = []
+    with tarfile.open(fileobj=fileobj, mode="r|") as tar:
+        for member in tar:
+            if member.isfile():
+                index.append([member.name, member.offset, member.offset_data, member.size])
+                if out_dir is not None and is_selected(member.name, sequences, modalities) and not is_extracted(out_dir, member.name, member.size):
+                    extract_member(tar, member, out_dir)
+            tar.members = []
+    return index
+
+
+def save_index(index_path, index):
+    """Saves the index of an archive"""
+    with open(index_path + ".tmp", "w") as fp:
+        json.dump(index, fp)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def load_index(index_path):
+    """Loads the index of an archive"""
+    with open(index_path) as fp:
+        return json.load(fp)
+
+
+def download_index(url, name, index_path, out_dir, sequences, modalities, progress, retries=5):
+    """
+    Builds the index of an archive by reading it entirely (only needed once), and extracts the files of
+    the given sequences and modalities on the way.
+    """
+
+    def download():
+        with open_url(url) as response:
+            progress.set_total(name, get_remaining_size(response))
+            save_index(index_path, build_index(CountingReader(response, progress), out_dir, sequences, modalities))
+        progress.set_total(name, None)
+
+    os.makedirs(out_dir, exist_ok=True)
+    print("\n No index for {}, building it from the whole archive (and extracting the selected files)".format(name))
+    retry(download, name, retries)
+
+
+def select_ranges(index, out_dir, sequences=None, modalities=None, max_gap=0):
+    """
+    Gets the byte ranges of an archive holding the files of the given sequences and modalities (all of
+    them if None) which were not extracted yet, as a list of (start, end, names). The ranges of files
+    separated by less than max_gap bytes are merged, to save requests.
+    """
+    selected = []
+    for name, offset, offset_data, size in index:
+        if not is_selected(name, sequences, modalities) or is_extracted(out_dir, name, size):
+            continue
+        selected.append((offset, offset_data - (-size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE, name))
+
+    ranges = []
+    for start, end, name in sorted(selected):
+        if ranges and start - ranges[-1][1] <= max_gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+            ranges[-1][2].add(name)
+        else:
+            ranges.append([start, end, {name}])
+    return [tuple(r) for r in ranges]
+
+
+def download_range(url, start, end, out_dir, names, progress, retries=5):
+    """Downloads the bytes [start, end) of an archive, which hold whole members, and extracts the given members"""
+
+    def download():
+        with open_url(url, start, end - 1) as response:
+            if response.status != 206:
+                raise Exception("The server does not support HTTP Range requests")
+            extract_stream(CountingReader(response, progress), out_dir, start, members=names)
+
+    os.makedirs(out_dir, exist_ok=True)
+    retry(download, url, retries)
+
+
+def run_jobs(jobs, nb_workers, progress, retries):
+    """Runs the given jobs (function and arguments) in parallel, and gets the ones which failed"""
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, nb_workers)) as executor:
+        futures = [(job, executor.submit(job[0], *job[1:], progress=progress, retries=retries)) for job in jobs]
+        for job, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print("\n Unable to download {}: {}".format(job[1], e))
+                failed.append(job)
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description="Downloads DADE dataset.")
     parser.add_argument("out_dir", help="output directory in which to store the data.")
     parser.add_argument("--dade", type=str, default="all", choices=["static", "dynamic", "all"], help="subset to download.")
+    parser.add_argument("--jobs", type=int, default=4, help="number of files downloaded in parallel (default: 4).")
+    parser.add_argument("--retries", type=int, default=5, help="number of times an interrupted download is resumed (default: 5).")
+    parser.add_argument("--base-url", type=str, default=BASE_URL, help="URL of the files (default: the DADE repository).")
+    parser.add_argument("--sequences", type=str, nargs="+", default=None, help="sequences to download (default: all).")
+    parser.add_argument("--modalities", type=str, nargs="+", default=None, choices=MODALITIES, help="modalities to download (default: all).")
+    parser.add_argument("--max-gap", type=int, default=1 << 20, help="maximum number of unneeded bytes downloaded to merge two requests (default: 1 MB).")
+    parser.add_argument("--index-dir", type=str, default=None, help="folder of the indexes of the archives (default: the dataset folder).")
+    parser.add_argument("--build-index", type=str, nargs="+", default=None, help="local archives to index (the script then exits).")
     args = parser.parse_args()
 
-    print("Thank you for downloading DADE dataset! \n")
-
     dataset_dir = os.path.join(args.out_dir, "DADE")
     if not os.path.isdir(dataset_dir):
         os.makedirs(dataset_dir)
-    
-    if not os.path.isfile(os.path.join(dataset_dir,"ReadMe.md")):
-        print("\n Downloading ReadMe.md")
-        url = BASE_URL + README_URL
-        wget.download(url, os.path.join(dataset_dir,"ReadMe.md"))
+    index_dir = args.index_dir if args.index_dir is not None else dataset_dir
 
-    if not os.path.isfile(os.path.join(dataset_dir,"Town12.png")):
-        print("\n Downloading Town12.png")
-        url = BASE_URL + TOWN12_URL
-        wget.download(url, os.path.join(dataset_dir,"Town12.png"))
+    if args.build_index is not None:
+        for path in args.build_index:
+            index_path = os.path.join(index_dir, os.path.basename(path) + ".index.json")
+            print("Indexing {} in {}".format(path, index_path))
+            with open(path, "rb") as fp:
+                save_index(index_path, build_index(fp))
+        return
 
+    print("Thank you for downloading DADE dataset! \n")
+
+    # We list the files and archives which were not downloaded yet
+    jobs = []
+    for file_name, file_id in [("ReadMe.md", README_URL), ("Town12.png", TOWN12_URL)]:
+        path = os.path.join(dataset_dir, file_name)
+        if not os.path.isfile(path):
+            jobs.append((download_file, args.base_url + file_id, path))
+    archives = []
     if args.dade != "dynamic": # == "static" or "all"
-        if not os.path.isfile(os.path.join(dataset_dir,"static_weather.tar")):
-            print("\n Downloading static_weather.tar")
-            url = BASE_URL + STATIC_URL
-            wget.download(url, os.path.join(dataset_dir,"static_weather.tar"))
-            print("\n Extracting static_weather.tar")
-            with tarfile.open(os.path.join(dataset_dir,"static_weather.tar")) as tar:
-                tar.extractall(path=dataset_dir)
-            os.remove(os.path.join(dataset_dir,"static_weather.tar"))
-        
-    
+        archives += STATIC_ARCHIVES
     if args.dade != "static": # == "dynamic" or "all"
-        print("\n For download, DADE-dynamic is divided into 3 parts.")
-        dynamic_dir = os.path.join(dataset_dir,"dynamic_weather")
-        if not os.path.isdir(dynamic_dir):
-            os.makedirs(dynamic_dir)
-        if not os.path.isfile(os.path.join(dataset_dir,"dynamic_weather_part1.tar")):
-            print("\n Downloading dynamic_weather_part1.tar")
-            url = BASE_URL + DYNAMIC_1_URL
-            wget.download(url, os.path.join(dataset_dir,"dynamic_weather_part1.tar"))
-            print("\n Extracting dynamic_weather_part1.tar")
-            with tarfile.open(os.path.join(dataset_dir,"dynamic_weather_part1.tar")) as tar:
-                tar.extractall(path=dynamic_dir)
-            os.remove(os.path.join(dataset_dir,"dynamic_weather_part1.tar"))
-        if not os.path.isfile(os.path.join(dataset_dir,"dynamic_weather_part2.tar")):
-            print("\n Downloading dynamic_weather_part2.tar")
-            url = BASE_URL + DYNAMIC_2_URL
-            wget.download(url, os.path.join(dataset_dir,"dynamic_weather_part2.tar"))
-            print("\n Extracting dynamic_weather_part2.tar")
-            with tarfile.open(os.path.join(dataset_dir,"dynamic_weather_part2.tar")) as tar:
-                tar.extractall(path=dynamic_dir)
-            os.remove(os.path.join(dataset_dir,"dynamic_weather_part2.tar"))
-        if not os.path.isfile(os.path.join(dataset_dir,"dynamic_weather_part3.tar")):
-            print("\n Downloading dynamic_weather_part3.tar")
-            url = BASE_URL + DYNAMIC_3_URL
-            wget.download(url, os.path.join(dataset_dir,"dynamic_weather_part3.tar"))
-            print("\n Extracting dynamic_weather_part3.tar")
-            with tarfile.open(os.path.join(dataset_dir,"dynamic_weather_part3.tar")) as tar:
-                tar.extractall(path=dynamic_dir)
-            os.remove(os.path.join(dataset_dir,"dynamic_weather_part3.tar"))
+        print("For download, DADE-dynamic is divided into 3 parts.")
+        archives += DYNAMIC_ARCHIVES
+    archives = [archive for archive in archives if not os.path.isfile(os.path.join(dataset_dir, "." + archive[0] + ".done"))]
+    selective = args.sequences is not None or args.modalities is not None
+    if not selective:
+        for name, file_id, folder in archives:
+            jobs.append((download_archive, args.base_url + file_id, name, os.path.join(dataset_dir, folder), dataset_dir))
+    else:
+        # The indexes of the archives are needed to select their members (the archives without index are
+        # read entirely, and their selected members are extracted at the same time)
+        for name, file_id, folder in archives:
+            index_path = os.path.join(index_dir, name + ".index.json")
+            if not os.path.isfile(index_path):
+                jobs.append((download_index, args.base_url + file_id, name, index_path, os.path.join(dataset_dir, folder), args.sequences, args.modalities))
+
+    # We download them in parallel
+    progress = Progress()
+    progress.start()
+    failed = run_jobs(jobs, args.jobs, progress, args.retries)
+
+    # We download the selected members of the archives, by ranges of bytes
+    if selective and not failed:
+        jobs = []
+        nb_members = 0
+        for name, file_id, folder in archives:
+            index = load_index(os.path.join(index_dir, name + ".index.json"))
+            out_dir = os.path.join(dataset_dir, folder)
+            for start, end, names in select_ranges(index, out_dir, args.sequences, args.modalities, args.max_gap):
+                jobs.append((download_range, args.base_url + file_id, start, end, out_dir, names))
+                nb_members += len(names)
+        print("\n Downloading {} files with {} requests".format(nb_members, len(jobs)))
+        failed = run_jobs(jobs, args.jobs, progress, args.retries)
+    progress.stop()
 
     print("\n")
+    if failed:
+        print("{} downloads failed, run the script again to resume them.".format(len(failed)))
+        sys.exit(1)
     print("Done!")
 
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Spatial index of the positions (gnss.json x,y) of the frames of DADE dataset.
+
+The frames are sorted by cell of a regular grid, so that the frames near a location are found by
+looking at a few cells only: the time of a query does not depend on the size of the dataset, but on
+the number of frames near the location. The index is built from the catalog of dade_catalog.py (the
+frame identifiers are the ones of the catalog).
+
+Script usage example:
+    python3 gnss_index.py  catalog.npz  gnss_index.npz  --cell-size 25
+    python3 gnss_index.py  catalog.npz  gnss_index.npz  --radius X Y R     # frames within R meters of (X, Y)
+"""
+
+import argparse
+
+import numpy as np
+
+from dade_catalog import Catalog
+
+CELL_SIZE = 25.0
+
+# Maximum number of frames compared with as many others at once, by revisit_pairs (bounds its memory)
+PAIR_BLOCK_SIZE = 1024
+
+# Offset of the cell coordinates in the cell keys, so that negative coordinates get positive keys
+_KEY_OFFSET = 1 << 31
+
+
+class GnssIndex:
+    """A grid index of the x,y positions of the frames"""
+
+    def __init__(self, x, y, sequence, cell_size=CELL_SIZE):
+        """Indexes the positions of the frames, and the sequence of each frame (to detect revisits)"""
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.sequence = np.asarray(sequence, dtype=np.int32)
+        self.cell_size = float(cell_size)
+
+        keys = self._get_keys(self._get_cells(self.x), self._get_cells(self.y))
+        self.order = np.argsort(keys, kind="stable") # Frame identifiers, sorted by cell
+        self.keys, self.starts = np.unique(keys[self.order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.order))
+
+    @classmethod
+    def from_catalog(cls, catalog, cell_size=CELL_SIZE):
+        """Indexes the frames of a catalog"""
+        return cls(catalog["x"], catalog["y"], catalog["sequence"], cell_size)
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index saved by save"""
+        with np.load(path) as npz:
+            index = cls.__new__(cls)
+            for name in ["x", "y", "sequence", "order", "keys", "starts", "ends"]:
+                setattr(index, name, npz[name])
+            index.cell_size = float(npz["cell_size"])
+        return index
+
+    def save(self, path):
+        np.savez(path, x=self.x, y=self.y, sequence=self.sequence, order=self.order, keys=self.keys,
+                 starts=self.starts, ends=self.ends, cell_size=self.cell_size)
+
+    def bbox(self, x_min, x_max, y_min, y_max):
+        """Gets the identifiers of the frames in a bounding box (limits included)"""
+        candidates = self._get_candidates(x_min, x_max, y_min, y_max)
+        x, y = self.x[candidates], self.y[candidates]
+        return np.sort(candidates[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)])
+
+    def radius(self, x, y, radius):
+        """Gets the identifiers of the frames within radius meters of (x, y)"""
+        candidates = self._get_candidates(x - radius, x + radius, y - radius, y + radius)
+        distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+        return np.sort(candidates[distances <= radius])
+
+    def segment(self, x1, y1, x2, y2, distance):
+        """Gets the identifiers of the frames within distance meters of the segment from (x1, y1) to (x2, y2)"""
+        candidates = self._get_candidates(min(x1, x2) - distance, max(x1, x2) + distance, min(y1, y2) - distance, max(y1, y2) + distance)
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = np.zeros(len(candidates)) if length == 0 else np.clip(((self.x[candidates] - x1) * dx + (self.y[candidates] - y1) * dy) / length, 0, 1)
+        distances = np.hypot(self.x[candidates] - (x1 + t * dx), self.y[candidates] - (y1 + t * dy))
+        return np.sort(candidates[distances <= distance])
+
+    def revisits(self, frame_id, radius):
+        """Gets the identifiers of the frames of the other sequences within radius meters of a frame"""
+        frames = self.radius(self.x[frame_id], self.y[frame_id], radius)
+        return frames[self.sequence[frames] != self.sequence[frame_id]]
+
+    def revisit_pairs(self, radius):
+        """
+        Gets all the pairs of frames of different sequences within radius meters of each other, as an
+        array of shape (N, 2) (with the smallest frame identifier first).
+        """
+        pairs = []
+        reach = int(np.ceil(radius / self.cell_size))
+        cells_x, cells_y = self._get_cells_of_keys(self.keys)
+        for cell_x, cell_y, start, end in zip(cells_x, cells_y, self.starts, self.ends):
+            frames = self.order[start:end]
+            # Each pair of cells is only looked at once: from the cell with the smallest key
+            cell_key = self._get_keys(cell_x, cell_y)
+            neighbour_keys = [self._get_keys(cell_x + i, cell_y + j) for i in range(-reach, reach + 1) for j in range(-reach, reach + 1)]
+            positions = np.searchsorted(self.keys, neighbour_keys)
+            for key, position in zip(neighbour_keys, positions):
+                if key < cell_key or position >= len(self.keys) or self.keys[position] != key:
+                    continue
+                others = self.order[self.starts[position]:self.ends[position]]
+                pairs.extend(self._get_close_pairs(frames, others, radius, key == cell_key))
+        return np.concatenate(pairs) if pairs else np.zeros((0, 2), dtype=np.int64)
+
+    def _get_close_pairs(self, frames, others, radius, same_cell):
+        # The frames are sorted by x, so that each block of frames is only compared with the others in
+        # its x range, by blocks as well: the memory used does not depend on the number of frames of the cells
+        frames = frames[np.argsort(self.x[frames], kind="stable")]
+        others = others[np.argsort(self.x[others], kind="stable")]
+        others_x = self.x[others]
+        pairs = []
+        for start in range(0, len(frames), PAIR_BLOCK_SIZE):
+            end = min(start + PAIR_BLOCK_SIZE, len(frames))
+            low = np.searchsorted(others_x, self.x[frames[start]] - radius, side="left")
+            high = np.searchsorted(others_x, self.x[frames[end - 1]] + radius, side="right")
+            if same_cell:
+                low = max(low, start) # The pairs of a cell are only looked at once
+            for other_start in range(low, high, PAIR_BLOCK_SIZE):
+                first, second = np.meshgrid(np.arange(start, end), np.arange(other_start, min(other_start + PAIR_BLOCK_SIZE, high)), indexing="ij")
+                first, second = first.ravel(), second.ravel()
+                keep = first < second if same_cell else np.ones(len(first), dtype=bool)
+                first, second = frames[first[keep]], others[second[keep]]
+                keep = (self.sequence[first] != self.sequence[second]) & (np.hypot(self.x[first] - self.x[second], self.y[first] - self.y[second]) <= radius)
+                pairs.append(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1)[keep])
+        return pairs
+
+    def _get_cells(self, values):
+        return np.floor(np.asarray(values) / self.cell_size).astype(np.int64)
+
+    def _get_keys(self, cells_x, cells_y):
+        return ((np.asarray(cells_x, dtype=np.int64) + _KEY_OFFSET) << 32) + (np.asarray(cells_y, dtype=np.int64) + _KEY_OFFSET)
+
+    def _get_cells_of_keys(self, keys):
+        return (keys >> 32) - _KEY_OFFSET, (keys & 0xFFFFFFFF) - _KEY_OFFSET
+
+    def _get_candidates(self, x_min, x_max, y_min, y_max):
+        cells_x = np.arange(self._get_cells(x_min), self._get_cells(x_max) + 1)
+        cells_y = np.arange(self._get_cells(y_min), self._get_cells(y_max) + 1)
+        keys = self._get_keys(*[cells.ravel() for cells in np.meshgrid(cells_x, cells_y, indexing="ij")])
+        positions = np.searchsorted(self.keys, keys).clip(0, max(0, len(self.keys) - 1))
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        if not found.any():
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.order[self.starts[p]:self.ends[p]] for p in positions[found]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the spatial index of the frames of DADE dataset, or queries it.")
+    parser.add_argument("catalog", help="catalog of the frames (dade_catalog.py).")
+    parser.add_argument("index", help="index to create (or to query, with --radius).")
+    parser.add_argument("--cell-size", type=float, default=CELL_SIZE, help="size of the cells of the grid, in meters (default: 25).")
+    parser.add_argument("--radius", type=float, nargs=3, default=None, metavar=("X", "Y", "R"), help="prints the frames within R meters of (X, Y).")
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    if args.radius is None:
+        index = GnssIndex.from_catalog(catalog, args.cell_size)
+        index.save(args.index)
+        print("Index of {} frames in {} cells saved in {}".format(len(index.order), len(index.keys), args.index))
+        return
+
+    index = GnssIndex.load(args.index)
+    for frame_id in index.radius(*args.radius):
+        print("{} (distance {:.1f} m)".format(catalog.get_path(frame_id, "semantic_masks_npz"),
+                                              np.hypot(index.x[frame_id] - args.radius[0], index.y[frame_id] - args.radius[1])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Zones of the Town12 map, given by Town12.png.
+
+The image is loaded once as a grid of zone identifiers (one uint8 per pixel), and the x,y coordinates
+of the frames (from gnss.json) are converted to zones with array operations. The zone of each frame
+can also be saved for all the sequences, in zones.json files.
+
+The image covers the rectangle [x_min, x_max] x [y_min, y_max] of the CARLA coordinates, with x going
+to the right and y going down. These bounds must be given:
+    python3 town12_zones.py  dataset_root/DADE/Town12.png  dataset_root/DADE  zones_root  --bounds x_min x_max y_min y_max
+
+The zones.json files are written in a separate folder, with the same layout as the dataset folder
+(zones_root/<subset>/<sequence>/zones.json), so that the dataset folder is left as downloaded.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+# Identifier, name and color of the zones
+ZONES = [
+    (0, "Forest", (85, 91, 25)),
+    (1, "Countryside", (111, 163, 27)),
+    (2, "Rural farmland", (237, 197, 0)),
+    (3, "Highway", (105, 110, 106)),
+    (4, "Low density residential", (13, 213, 148)),
+    (5, "Community buildings", (0, 147, 230)),
+    (6, "High density residential", (213, 42, 0)),
+]
+
+# Identifier of the pixels of another color, and of the coordinates outside of the image
+UNKNOWN_ZONE = 255
+
+ZONES_JSON = "zones.json"
+
+
+class ZoneMap:
+    """The zones of Town12, as a grid of zone identifiers"""
+
+    def __init__(self, path, bounds):
+        """Loads the image of the zones, which covers bounds = (x_min, x_max, y_min, y_max)"""
+        with Image.open(path) as image:
+            rgb = np.asarray(image.convert("RGB")).astype(np.uint32)
+        keys = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+        self.grid = np.full(keys.shape, UNKNOWN_ZONE, dtype=np.uint8)
+        for zone, _, (r, g, b) in ZONES:
+            self.grid[keys == (r << 16) | (g << 8) | b] = zone
+        self.x_min, self.x_max, self.y_min, self.y_max = bounds
+
+    def lookup(self, x, y):
+        """Gets the zones of arrays of x,y coordinates (UNKNOWN_ZONE outside of the map)"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        height, width = self.grid.shape
+        columns = np.floor((x - self.x_min) / (self.x_max - self.x_min) * width).astype(np.int64)
+        rows = np.floor((y - self.y_min) / (self.y_max - self.y_min) * height).astype(np.int64)
+        inside = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+        zones = np.full(x.shape, UNKNOWN_ZONE, dtype=np.uint8)
+        zones[inside] = self.grid[rows[inside], columns[inside]]
+        return zones
+
+    def get_sequence_zones(self, sequence_dir):
+        """Gets the zone of each frame of a sequence, as a dictionary (None for the unknown zones)"""
+        with open(os.path.join(sequence_dir, "gnss.json")) as fp:
+            gnss = json.load(fp)
+        frames = sorted(gnss, key=int)
+        zones = self.lookup([gnss[frame]["x"] for frame in frames], [gnss[frame]["y"] for frame in frames])
+        return {int(frame): (int(zone) if zone != UNKNOWN_ZONE else None) for frame, zone in zip(frames, zones)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Saves the Town12 zone of each frame of DADE sequences (zones.json).")
+    parser.add_argument("map", help="path to Town12.png.")
+    parser.add_argument("root", help="dataset folder or sequence folder.")
+    parser.add_argument("output", help="folder where the zones.json files are written, by sequence (outside of the dataset folder).")
+    parser.add_argument("--bounds", type=float, nargs=4, required=True, metavar=("X_MIN", "X_MAX", "Y_MIN", "Y_MAX"), help="coordinates covered by the image.")
+    args = parser.parse_args()
+
+    zone_map = ZoneMap(args.map, args.bounds)
+    for folder, dirs, file_names in os.walk(args.root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("semantic_masks") and d != "images")
+        if "gnss.json" in file_names:
+            zones = zone_map.get_sequence_zones(folder)
+            output_dir = os.path.join(args.output, os.path.relpath(folder, args.root))
+            os.makedirs(output_dir, exist_ok=True)
+            with open(os.path.join(output_dir, ZONES_JSON), "w") as fp:
+                json.dump(zones, fp, sort_keys=True, indent=4)
+            nb_unknown = sum(zone is None for zone in zones.values())
+            print("{}: {} frames ({} in an unknown zone)".format(folder, len(zones), nb_unknown))
+
+
+if __name__ == "__main__":
+    main()
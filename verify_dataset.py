@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""
+Integrity check script for DADE dataset.
+
+A manifest of the dataset (size and hash of each file, number of frames of each sequence) can be
+created once, and the files can be checked against it later:
+    python3 verify_dataset.py  manifest  dataset_root/DADE  manifest.json
+    python3 verify_dataset.py  verify    dataset_root/DADE  --manifest manifest.json
+
+Even without a manifest, the verification checks that each sequence holds all its frames: the frames
+of gnss.json (and the length given in the sequence json file, if any) must all be present in the
+semantic_masks, semantic_masks_npz and semantic_masks_carla folders, in the right sub-folders.
+
+The files are hashed in parallel, and the hashes are cached (in a sqlite database, keyed on the size
+and modification time of the files), so that only the files which changed are hashed again.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+
+HASH_ALGORITHM = "blake2b"
+CHUNK_SIZE = 1 << 20
+CACHE_NAME = ".verify_cache.sqlite"
+
+# Folders of a sequence holding one file per frame, and extension of these files
+FRAME_FOLDERS = {"semantic_masks": ".png", "semantic_masks_npz": ".npz", "semantic_masks_carla": ".png", "images": ".png"}
+
+
+class HashCache:
+    """Hashes of the files, stored in a sqlite database and keyed on the size and modification time of the files"""
+
+    def __init__(self, path=None):
+        self.connection = sqlite3.connect(path if path is not None else ":memory:")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT)")
+
+    def get(self, path, size, mtime):
+        row = self.connection.execute("SELECT size, mtime, hash FROM hashes WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == size and row[1] == mtime:
+            return row[2]
+        return None
+
+    def set(self, path, size, mtime, file_hash):
+        self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)", (path, size, mtime, file_hash))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def list_files(root):
+    """Gets the size and modification time of the files of the dataset (hidden files excepted), by relative path"""
+    files = {}
+    for folder, dirs, file_names in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file_name in file_names:
+            if file_name.startswith("."):
+                continue
+            path = os.path.join(folder, file_name)
+            stat = os.stat(path)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def hash_file(path):
+    """Gets the hash of a file"""
+    file_hash = hashlib.new(HASH_ALGORITHM)
+    with open(path, "rb") as fp:
+        while True:
+            data = fp.read(CHUNK_SIZE)
+            if not data:
+                break
+            file_hash.update(data)
+    return file_hash.hexdigest()
+
+
+def hash_files(root, files, cache, nb_workers):
+    """Gets the hash of the given files, computing in parallel the ones which are not in the cache"""
+    hashes = {}
+    to_hash = []
+    for path, (size, mtime) in files.items():
+        file_hash = cache.get(path, size, mtime)
+        if file_hash is None:
+            to_hash.append(path)
+        else:
+            hashes[path] = file_hash
+    print("{} files, {} to hash".format(len(files), len(to_hash)))
+
+    with ThreadPoolExecutor(max_workers=max(1, nb_workers)) as executor:
+        for i, (path, file_hash) in enumerate(zip(to_hash, executor.map(hash_file, [os.path.join(root, path) for path in to_hash]))):
+            hashes[path] = file_hash
+            cache.set(path, files[path][0], files[path][1], file_hash)
+            if (i + 1) % 10000 == 0:
+                print("\r Hashed {}/{} files".format(i + 1, len(to_hash)), end="", flush=True)
+    if len(to_hash) >= 10000:
+        print()
+    return hashes
+
+
+def get_frame_path(folder, frame, extension):
+    """Gets the path of the file of a frame, with 1000 frames per sub-folder"""
+    return "{}/{:03d}/{:06d}{}".format(folder, frame // 1000 + 1, frame, extension)
+
+
+def find_sequences(files):
+    """Gets the relative paths of the sequences (the folders holding a gnss.json file)"""
+    return sorted(os.path.dirname(path) for path in files if os.path.basename(path) == "gnss.json")
+
+
+def count_frames(root, sequence, files):
+    """Gets the number of frames of a sequence: in gnss.json, in the sequence json file, and in each frame folder"""
+    with open(os.path.join(root, sequence, "gnss.json")) as fp:
+        frames = sorted(int(frame) for frame in json.load(fp))
+    counts = {"gnss": len(frames)}
+
+    sequence_json = os.path.join(root, sequence, os.path.basename(sequence) + ".json")
+    if os.path.isfile(sequence_json):
+        with open(sequence_json) as fp:
+            seq_length = json.load(fp).get("seq_length")
+        if isinstance(seq_length, int):
+            counts["seq_length"] = seq_length
+
+    prefix = sequence + "/" if sequence else ""
+    for folder, extension in FRAME_FOLDERS.items():
+        if any(path.startswith(prefix + folder + "/") for path in files):
+            counts[folder] = sum(prefix + get_frame_path(folder, frame, extension) in files for frame in frames)
+    return counts, frames
+
+
+def check_sequences(root, files):
+    """Checks that all the frames of the sequences are present. Returns the counts of frames and the errors."""
+    # We group the files by sequence, to check each sequence against its own files only
+    sequences = find_sequences(files)
+    files_by_sequence = {sequence: set() for sequence in sequences}
+    for path in files:
+        parts = path.split("/")
+        for i in range(len(parts) - 1, -1, -1):
+            sequence = "/".join(parts[:i])
+            if sequence in files_by_sequence:
+                files_by_sequence[sequence].add(path)
+                break
+
+    counts = {}
+    errors = []
+    for sequence in sequences:
+        sequence_counts, frames = count_frames(root, sequence, files_by_sequence[sequence])
+        counts[sequence] = sequence_counts
+        if frames != list(range(1, len(frames) + 1)):
+            errors.append("{}: the frames of gnss.json are not numbered from 1 to {}".format(sequence, len(frames)))
+        if "seq_length" in sequence_counts and sequence_counts["seq_length"] != len(frames):
+            errors.append("{}: {} frames in gnss.json, but a length of {}".format(sequence, len(frames), sequence_counts["seq_length"]))
+        for folder in FRAME_FOLDERS:
+            if folder in sequence_counts and sequence_counts[folder] != len(frames):
+                errors.append("{}: {} frames missing in {}".format(sequence, len(frames) - sequence_counts[folder], folder))
+    return counts, errors
+
+
+def create_manifest(root, output, cache, nb_workers):
+    """Creates the manifest of the dataset"""
+    files = list_files(root)
+    hashes = hash_files(root, files, cache, nb_workers)
+    counts, errors = check_sequences(root, files)
+    for error in errors:
+        print(" Warning: " + error)
+    manifest = {"algorithm": HASH_ALGORITHM,
+                "files": {path: [files[path][0], hashes[path]] for path in sorted(files)},
+                "sequences": counts}
+    with open(output, "w") as fp:
+        json.dump(manifest, fp, indent=1)
+    print("Manifest of {} files and {} sequences saved in {}".format(len(files), len(counts), output))
+
+
+def verify(root, manifest_path, cache, nb_workers):
+    """Verifies the dataset (against its manifest, if any). Returns the list of errors."""
+    files = list_files(root)
+    counts, errors = check_sequences(root, files)
+
+    if manifest_path is not None:
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+        if manifest["algorithm"] != HASH_ALGORITHM:
+            raise Exception("Unsupported hash algorithm {}!".format(manifest["algorithm"]))
+        expected = manifest["files"]
+        errors += ["{}: missing".format(path) for path in sorted(set(expected) - set(files))]
+        errors += ["{}: not in the manifest".format(path) for path in sorted(set(files) - set(expected))]
+
+        # Files with the wrong size are not hashed
+        common = [path for path in sorted(set(files) & set(expected))]
+        errors += ["{}: size {} instead of {}".format(path, files[path][0], expected[path][0]) for path in common if files[path][0] != expected[path][0]]
+        hashes = hash_files(root, {path: files[path] for path in common if files[path][0] == expected[path][0]}, cache, nb_workers)
+        errors += ["{}: wrong hash".format(path) for path, file_hash in sorted(hashes.items()) if file_hash != expected[path][1]]
+
+        for sequence, sequence_counts in manifest["sequences"].items():
+            if counts.get(sequence) != sequence_counts:
+                errors.append("{}: frames {} instead of {}".format(sequence, counts.get(sequence), sequence_counts))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates the manifest of DADE dataset, or verifies the dataset.")
+    parser.add_argument("command", choices=["manifest", "verify"], help="create the manifest, or verify the dataset.")
+    parser.add_argument("root", help="path to the dataset (or to a part of it).")
+    parser.add_argument("output", nargs="?", default="manifest.json", help="manifest to create (default: manifest.json).")
+    parser.add_argument("--manifest", type=str, default=None, help="manifest to verify the dataset against (default: only check the frames).")
+    parser.add_argument("--workers", type=int, default=8, help="number of files hashed in parallel (default: 8).")
+    parser.add_argument("--cache", type=str, default=None, help="cache of the hashes (default: {} in the dataset folder).".format(CACHE_NAME))
+    parser.add_argument("--no-cache", action="store_true", help="hash all the files again.")
+    args = parser.parse_args()
+
+    cache = HashCache(None if args.no_cache else args.cache if args.cache is not None else os.path.join(args.root, CACHE_NAME))
+    try:
+        if args.command == "manifest":
+            create_manifest(args.root, args.output, cache, args.workers)
+            return
+        errors = verify(args.root, args.manifest, cache, args.workers)
+    finally:
+        cache.close()
+
+    for error in errors:
+        print(" " + error)
+    if errors:
+        print("{} errors found.".format(len(errors)))
+        sys.exit(1)
+    print("No error found.")
+
+
+if __name__ == "__main__":
+    main()